@@ -1,4 +1,7 @@
-import pandas as pd
+import csv
+import functools
+import os
+import pickle
 import re
 
 
@@ -8,6 +11,18 @@ import re
 INPUT_FILE = "lista_cartas.txt"
 OUTPUT_FILE = "lista_cartas_con_tags.txt"
 INVENTORY_FILE = "inventario.csv"
+INVENTORY_CACHE_FILE = ".inv_cache_tags.pkl"  # Mapa precalculado (se invalida por mtime del CSV)
+WRITE_BUFFER_LINES = 8192  # Líneas acumuladas antes de escribir a disco
+
+
+# =========================
+# PATRONES PRECOMPILADOS
+# =========================
+# Tags existentes y marcadores en una sola pasada
+_CLEAN_RE = re.compile(r'#\S+|[⭐🔥💰🔗📘📗\[\]]')
+
+# Caracteres especiales a remover/reemplazar en nombres de colección
+_SANITIZE_TRANS = str.maketrans({",": "", "'": "", ":": "", "/": "_", "-": "_"})
 
 
 # =========================
@@ -15,25 +30,51 @@ INVENTORY_FILE = "inventario.csv"
 # =========================
 def load_inventory():
     """
-    Carga el inventario y crea un mapa de carta -> colecciones
+    Carga el inventario y crea un mapa de carta -> tags de colección
+    (los nombres de colección ya vienen sanitizados)
     """
     print(f"📦 Cargando inventario desde: {INVENTORY_FILE}")
     
-    inv = pd.read_csv(INVENTORY_FILE)
-    inv["name_lower"] = inv["name"].str.lower()
+    # Reutilizar el mapa precalculado si el CSV no cambió desde entonces
+    csv_mtime = os.path.getmtime(INVENTORY_FILE)
+    if os.path.exists(INVENTORY_CACHE_FILE) and os.path.getmtime(INVENTORY_CACHE_FILE) >= csv_mtime:
+        try:
+            with open(INVENTORY_CACHE_FILE, 'rb') as f:
+                card_collections = pickle.load(f)
+            print(f"   ✅ {len(card_collections)} cartas únicas cargadas (caché)")
+            return card_collections
+        except Exception:
+            pass
     
-    # Crear mapa: nombre_carta -> lista de colecciones
+    # Crear mapa: nombre_carta -> colecciones
+    # (dict como conjunto ordenado: deduplica en O(1) y conserva el orden)
     card_collections = {}
     
-    for _, row in inv.iterrows():
-        name_lower = row["name_lower"]
-        collection = str(row["source"])
-        
-        if name_lower not in card_collections:
-            card_collections[name_lower] = []
+    with open(INVENTORY_FILE, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        name_idx = header.index("name")
+        source_idx = header.index("source")
         
-        if collection not in card_collections[name_lower]:
-            card_collections[name_lower].append(collection)
+        for row in reader:
+            if not row:
+                continue
+            
+            name_lower = row[name_idx].lower()
+            collection = row[source_idx]
+            
+            card_collections.setdefault(name_lower, {})[collection] = None
+    
+    card_collections = {
+        name_lower: [sanitize_collection_name(c) for c in collections]
+        for name_lower, collections in card_collections.items()
+    }
+    
+    try:
+        with open(INVENTORY_CACHE_FILE, 'wb') as f:
+            pickle.dump(card_collections, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
     
     print(f"   ✅ {len(card_collections)} cartas únicas cargadas")
     return card_collections
@@ -42,14 +83,14 @@ def load_inventory():
 # =========================
 # 2. SANITIZAR NOMBRE DE COLECCIÓN
 # =========================
+@functools.lru_cache(maxsize=None)
 def sanitize_collection_name(collection):
     """
     Convierte nombre de colección a formato tag limpio
     Ejemplo: "Commander Precons" -> "Commander_Precons"
     """
     # Remover caracteres especiales
-    clean = collection.replace(",", "").replace("'", "").replace(":", "")
-    clean = clean.replace("/", "_").replace("-", "_")
+    clean = collection.translate(_SANITIZE_TRANS)
     # Reemplazar espacios con guiones bajos
     clean = "_".join(clean.split())
     return clean
@@ -58,6 +99,29 @@ def sanitize_collection_name(collection):
 # =========================
 # 3. LIMPIAR NOMBRE DE CARTA
 # =========================
+def split_count_prefix(line):
+    """
+    Separa el número al inicio de la línea sin usar regex
+    (seguido de cualquier espacio en blanco: espacio, tabulador o salto de línea)
+    Ejemplo: "1 Sol Ring" -> ("1 ", "Sol Ring")
+    """
+    parts = line.split(None, 1)
+    num = parts[0] if parts else ""
+    
+    # El número debe estar al principio de la línea y ser solo dígitos
+    if not num.isdecimal() or not line.startswith(num):
+        return "", line
+    
+    rest = line[len(num):]
+    card = rest.lstrip()
+    
+    # Sin espacio en blanco después del número ("1" al final del archivo)
+    if len(card) == len(rest):
+        return "", line
+    
+    return line[:len(line) - len(card)], card
+
+
 def clean_card_name(line):
     """
     Limpia una línea para extraer el nombre de la carta
@@ -66,27 +130,35 @@ def clean_card_name(line):
     - Tags existentes (#Commander)
     - Marcadores (⭐ 🔥)
     - Comentarios (#)
+    
+    Retorna (nombre_limpio, línea_original, prefijo_numérico)
     """
     # Remover comentarios completos
     if line.strip().startswith("#"):
-        return None, line.strip()
+        return None, line.strip(), ""
     
     # Guardar la línea original
     original = line.strip()
     
-    # Remover número al inicio
-    cleaned = re.sub(r'^\d+\s+', '', line)
-    
-    # Remover tags existentes
-    cleaned = re.sub(r'#\S+', '', cleaned)
-    
-    # Remover marcadores emoji
-    cleaned = re.sub(r'[⭐🔥💰🔗📘📗\[\]]', '', cleaned)
+    # Separar el número al inicio para reconstruir la línea
+    prefix, rest = split_count_prefix(line)
     
-    # Remover espacios extra
-    cleaned = cleaned.strip()
+    # Remover tags, marcadores y espacios extra
+    cleaned = _CLEAN_RE.sub('', rest).strip()
     
-    return cleaned, original
+    return cleaned, original, prefix
+
+
+# =========================
+# 3B. ESCRIBIR BLOQUE DE LÍNEAS
+# =========================
+def flush_lines(f, lines):
+    """
+    Escribe un bloque de líneas con una sola llamada a write() y vacía el buffer
+    """
+    if lines:
+        f.write("\n".join(lines) + "\n")
+        lines.clear()
 
 
 # =========================
@@ -105,57 +177,46 @@ def process_file(input_file, output_file, card_collections):
     output_lines = []
     not_found_cards = []
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    for line in lines:
-        # Limpiar la carta
-        card_name, original_line = clean_card_name(line)
-        
-        # Si es comentario completo, mantener tal cual
-        if card_name is None:
-            output_lines.append(original_line)
-            comment_count += 1
-            continue
-        
-        # Si es línea vacía, mantener
-        if not card_name:
-            output_lines.append("")
-            continue
-        
-        # Buscar en inventario
-        card_lower = card_name.lower()
-        
-        if card_lower in card_collections:
-            collections = card_collections[card_lower]
+    # Leer y escribir en una sola pasada, volcando a disco por bloques
+    with open(input_file, 'r', encoding='utf-8') as in_f, \
+         open(output_file, 'w', encoding='utf-8') as out_f:
+        for line in in_f:
+            if len(output_lines) >= WRITE_BUFFER_LINES:
+                flush_lines(out_f, output_lines)
+            
+            # Limpiar la carta
+            card_name, original_line, prefix = clean_card_name(line)
             
-            # Si tiene múltiples colecciones, usar la primera
-            collection = collections[0]
+            # Si es comentario completo, mantener tal cual
+            if card_name is None:
+                output_lines.append(original_line)
+                comment_count += 1
+                continue
             
-            # Sanitizar nombre de colección
-            collection_tag = sanitize_collection_name(collection)
+            # Si es línea vacía, mantener
+            if not card_name:
+                output_lines.append("")
+                continue
             
-            # Reconstruir línea
-            # Detectar si tenía número al inicio
-            match = re.match(r'^(\d+\s+)', line)
-            if match:
-                prefix = match.group(1)
+            # Buscar en inventario (una sola búsqueda en el dict)
+            collections = card_collections.get(card_name.lower())
+            
+            if collections is not None:
+                # Si tiene múltiples colecciones, usar la primera
+                collection_tag = collections[0]
+                
+                # Reconstruir línea (conservando el número al inicio si lo tenía)
                 new_line = f"{prefix}{card_name} #{collection_tag}"
+                
+                output_lines.append(new_line)
+                found_count += 1
             else:
-                new_line = f"{card_name} #{collection_tag}"
-            
-            output_lines.append(new_line)
-            found_count += 1
-        else:
-            # Carta no encontrada en inventario
-            output_lines.append(original_line + " #NOT_FOUND")
-            not_found_cards.append(card_name)
-            not_found_count += 1
-    
-    # Escribir archivo de salida
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for line in output_lines:
-            f.write(line + "\n")
+                # Carta no encontrada en inventario
+                output_lines.append(original_line + " #NOT_FOUND")
+                not_found_cards.append(card_name)
+                not_found_count += 1
+        
+        flush_lines(out_f, output_lines)
     
     # Mostrar estadísticas
     print(f"\n✅ Procesamiento completado:")
@@ -187,46 +248,38 @@ def process_with_all_collections(input_file, output_file, card_collections):
     
     output_lines = []
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    for line in lines:
-        card_name, original_line = clean_card_name(line)
-        
-        if card_name is None:
-            output_lines.append(original_line)
-            continue
-        
-        if not card_name:
-            output_lines.append("")
-            continue
-        
-        card_lower = card_name.lower()
-        
-        if card_lower in card_collections:
-            collections = card_collections[card_lower]
+    with open(input_file, 'r', encoding='utf-8') as in_f, \
+         open(output_file, 'w', encoding='utf-8') as out_f:
+        for line in in_f:
+            if len(output_lines) >= WRITE_BUFFER_LINES:
+                flush_lines(out_f, output_lines)
             
-            # Crear tags para todas las colecciones
-            tags = " ".join([f"#{sanitize_collection_name(c)}" for c in collections])
+            card_name, original_line, prefix = clean_card_name(line)
             
-            # Reconstruir línea
-            match = re.match(r'^(\d+\s+)', line)
-            if match:
-                prefix = match.group(1)
+            if card_name is None:
+                output_lines.append(original_line)
+                continue
+            
+            if not card_name:
+                output_lines.append("")
+                continue
+            
+            collections = card_collections.get(card_name.lower())
+            
+            if collections is not None:
+                # Crear tags para todas las colecciones
+                tags = " ".join([f"#{c}" for c in collections])
+                
+                # Reconstruir línea
                 new_line = f"{prefix}{card_name} {tags}"
+                
+                output_lines.append(new_line)
+                found_count += 1
             else:
-                new_line = f"{card_name} {tags}"
-            
-            output_lines.append(new_line)
-            found_count += 1
-        else:
-            output_lines.append(original_line + " #NOT_FOUND")
-            not_found_count += 1
-    
-    # Escribir archivo
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for line in output_lines:
-            f.write(line + "\n")
+                output_lines.append(original_line + " #NOT_FOUND")
+                not_found_count += 1
+        
+        flush_lines(out_f, output_lines)
     
     print(f"\n✅ Procesamiento completado:")
     print(f"   • {found_count} cartas taggeadas")
@@ -246,7 +299,6 @@ if __name__ == "__main__":
     card_collections = load_inventory()
     
     # Verificar que existe el archivo de entrada
-    import os
     if not os.path.exists(INPUT_FILE):
         print(f"\n❌ Error: No se encuentra el archivo '{INPUT_FILE}'")
         print(f"   Crea un archivo con ese nombre con tu lista de cartas.")
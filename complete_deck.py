@@ -1,9 +1,29 @@
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import os
+import pickle
+import unicodedata
 import pandas as pd
 import requests
+import xlsxwriter
 import re
+import threading
 import time
 import json
 from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+
+# orjson (opcional) parsea JSON varias veces más rápido que el módulo estándar
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 
 # =========================
@@ -11,6 +31,7 @@ from collections import defaultdict, Counter
 # =========================
 PARTIAL_DECKLIST_FILE = "mazos_a_medias.txt"  # Tu archivo con mazos parciales
 INVENTORY_FILE = "inventario.csv"
+INVENTORY_CACHE_FILE = ".inv_cache_deck.pkl"  # Mapa precalculado (se invalida por mtime del CSV)
 OUTPUT_DIR = "mazos_completados"
 RATE_LIMIT = 0.05
 MIN_SYNERGY_SCORE = 0.10  # Reducido de 0.15 (más permisivo)
@@ -19,7 +40,24 @@ KEY_CARD_INCLUSION_MIN = 0.40  # 40% mínimo para "carta clave"
 KEY_CARD_PRICE_MAX = 2.00  # $2 USD máximo
 MIN_SCORE_THRESHOLD = 5    # Score mínimo para considerar
 CHECK_COLOR_IDENTITY = True  # CRÍTICO: Verificar colores
-COLOR_CHECK_RATE_LIMIT = 0.1  # Rate limit para Scryfall API
+COLOR_CHECK_RATE_LIMIT = 0.1  # Rate limit para Scryfall API (entre lotes)
+SCRYFALL_BATCH_SIZE = 75     # Máximo de cartas por petición a /cards/collection
+MAX_WORKERS = 10             # Peticiones HTTP concurrentes
+CACHE_DIR = ".edhrec_cache"  # Caché en disco de respuestas de EDHREC (compartida con find_best_commanders.py)
+CACHE_TTL = 7 * 24 * 3600    # Segundos antes de volver a descargar (7 días, igual que find_best_commanders.py)
+SCRYFALL_ORACLE_FILE = "scryfall_oracle.pkl"  # Índice local de identidades de color
+SCRYFALL_ORACLE_TTL = 7 * 24 * 3600           # Refrescar el bulk de Scryfall cada semana
+COMMANDER_COLORS_FILE = "colores_comandantes.json"  # Opcional: {"palabra clave": "WUBRG"}
+MAX_SHEET_HYPERLINKS = 65530  # Límite de Excel de hipervínculos por hoja
+
+
+# =========================
+# PATRONES PRECOMPILADOS
+# =========================
+_TAG_RE = re.compile(r'#\w+')
+_MARKER_RE = re.compile(r'[⭐🔥\[\]]')
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+_SLUG_DROP = str.maketrans("", "", "',:.")  # Caracteres que se eliminan del slug
 
 
 # =========================
@@ -31,7 +69,9 @@ from urllib3.util.retry import Retry
 def create_session():
     session = requests.Session()
     retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retry)
+    # Un pool de conexiones keep-alive por host del tamaño del pool de hilos:
+    # cada hilo reutiliza una conexión abierta en vez de abrir y descartar otras
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=MAX_WORKERS, pool_block=True)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
@@ -39,26 +79,86 @@ def create_session():
 SESSION = create_session()
 
 
+# =========================
+# CACHÉ EDHREC EN DISCO
+# =========================
+def fetch_json(url):
+    """
+    GET con caché en disco (JSON comprimido con gzip) indexado por URL
+    Retorna el JSON parseado, o None si la respuesta no es 200
+    """
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    path = Path(CACHE_DIR) / digest[:2] / f"{digest}.json.gz"
+    
+    if path.exists() and time.time() - path.stat().st_mtime < CACHE_TTL:
+        return json_loads(gzip.decompress(path.read_bytes()))
+    
+    r = SESSION.get(url, timeout=10)
+    if r.status_code != 200:
+        return None
+    
+    data = json_loads(r.content)
+    
+    # Escritura atómica (tmp propio de cada proceso e hilo) para no dejar archivos corruptos;
+    # si la caché no se puede escribir, la respuesta descargada se devuelve igualmente
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(gzip.compress(r.content))
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+    
+    return data
+
+
 # =========================
 # 1. CARGAR INVENTARIO
 # =========================
 def load_inventory():
     """Carga y procesa el inventario"""
-    inv = pd.read_csv(INVENTORY_FILE)
-    inv["name_lower"] = inv["name"].str.lower()
+    # Reutilizar el mapa precalculado si el CSV no cambió desde entonces
+    cache = Path(INVENTORY_CACHE_FILE)
+    if cache.exists() and cache.stat().st_mtime >= os.path.getmtime(INVENTORY_FILE):
+        try:
+            return pickle.loads(cache.read_bytes())
+        except Exception:
+            pass
+    
+    names = {}
+    quantities = Counter()
+    collections = defaultdict(list)
+    
+    with open(INVENTORY_FILE, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            name = row["name"]
+            name_lower = name.lower()
+            
+            names.setdefault(name_lower, name)
+            # Cantidades como "2.0" o " 2 " (pandas las aceptaba); las inválidas cuentan 0
+            try:
+                quantities[name_lower] += int(float((row["quantity"] or "").strip() or 0))
+            except (ValueError, OverflowError):
+                pass
+            collections[name_lower].append(row["source"])
     
     # Crear mapa de cartas disponibles
-    inv_map = {}
-    for _, row in inv.iterrows():
-        name_lower = row["name_lower"]
-        if name_lower not in inv_map:
-            inv_map[name_lower] = {
-                "name": row["name"],
-                "quantity": 0,
-                "collections": []
-            }
-        inv_map[name_lower]["quantity"] += row["quantity"]
-        inv_map[name_lower]["collections"].append(str(row["source"]))
+    inv_map = {
+        name_lower: {
+            "name": name,
+            "quantity": quantities[name_lower],
+            "collections": collections[name_lower]
+        }
+        for name_lower, name in names.items()
+    }
+    
+    try:
+        cache.write_bytes(pickle.dumps(inv_map, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass
     
     return inv_map
 
@@ -93,26 +193,24 @@ def parse_partial_decklists(filepath):
                 commander = line.split(":", 1)[1].strip()
                 current_deck = {
                     "commander": commander,
-                    "cards": []
+                    "cards": [],
+                    "cards_lower": []
                 }
             
             elif line and not line.startswith("#") and current_deck:
                 # Parsear línea tipo "1 Card Name" o "Card Name"
-                parts = line.split(None, 1)
-                if len(parts) == 2 and parts[0].isdigit():
-                    card_name = parts[1]
-                elif len(parts) == 1:
-                    card_name = parts[0]
-                else:
-                    continue
+                # (el número se separa por cualquier espacio en blanco, p. ej. tabulador)
+                num, *rest = line.split(None, 1)
+                card_name = rest[0] if rest and num.isdigit() else line
                 
                 # Limpiar tags y marcadores
-                card_name = re.sub(r'#\w+', '', card_name)  # Remover tags
-                card_name = re.sub(r'[⭐🔥\[\]]', '', card_name)  # Remover marcadores
+                card_name = _TAG_RE.sub('', card_name)  # Remover tags
+                card_name = _MARKER_RE.sub('', card_name)  # Remover marcadores
                 card_name = card_name.strip()
                 
                 if card_name:
                     current_deck["cards"].append(card_name)
+                    current_deck["cards_lower"].append(card_name.lower())
         
         if current_deck:
             decks.append(current_deck)
@@ -123,6 +221,7 @@ def parse_partial_decklists(filepath):
 # =========================
 # 3. OBTENER IDENTIDAD DE COLORES (MEJORADO)
 # =========================
+@functools.lru_cache(maxsize=1024)
 def get_commander_colors(commander_name):
     """
     Obtiene la identidad de colores del comandante desde EDHREC
@@ -131,38 +230,37 @@ def get_commander_colors(commander_name):
     url = f"https://json.edhrec.com/pages/commanders/{slug(commander_name)}.json"
     
     try:
-        r = SESSION.get(url, timeout=10)
-        if r.status_code != 200:
-            print(f"      ⚠️  No se pudo obtener página del comandante (código {r.status_code})")
+        data = fetch_json(url)
+        if data is None:
+            print(f"      ⚠️  No se pudo obtener página del comandante")
             return guess_colors_from_name(commander_name)
         
-        data = r.json()
-        
         # Método 1: Buscar "coloridentity" directamente
-        def find_color_identity(obj, depth=0):
-            if depth > 10:  # Evitar recursión infinita
-                return None
+        def find_color_identity(root):
+            # DFS iterativo en el mismo orden que la versión recursiva
+            stack = [root]
+            pop = stack.pop
             
-            if isinstance(obj, dict):
-                # Buscar coloridentity
-                if "coloridentity" in obj:
-                    return obj["coloridentity"]
+            while stack:
+                obj = pop()
                 
-                # Buscar colors (alternativo)
-                if "colors" in obj and isinstance(obj["colors"], list):
-                    return obj["colors"]
+                if isinstance(obj, dict):
+                    # Buscar coloridentity
+                    if "coloridentity" in obj:
+                        if obj["coloridentity"]:
+                            return obj["coloridentity"]
+                        continue
+                    
+                    # Buscar colors (alternativo)
+                    if "colors" in obj and isinstance(obj["colors"], list):
+                        if obj["colors"]:
+                            return obj["colors"]
+                        continue
+                    
+                    stack.extend(reversed(obj.values()))
                 
-                # Buscar recursivamente
-                for v in obj.values():
-                    result = find_color_identity(v, depth + 1)
-                    if result:
-                        return result
-            
-            elif isinstance(obj, list):
-                for item in obj:
-                    result = find_color_identity(item, depth + 1)
-                    if result:
-                        return result
+                elif isinstance(obj, list):
+                    stack.extend(reversed(obj))
             
             return None
         
@@ -193,6 +291,27 @@ def get_commander_colors(commander_name):
         return guess_colors_from_name(commander_name)
 
 
+# Colores conocidos por palabra clave en el nombre del comandante
+# Se pueden agregar más en COMMANDER_COLORS_FILE sin tocar el código
+COMMANDER_COLORS = {
+    "atraxa": "WUBG",
+    "muldrotha": "UBG",
+    "korvold": "BRG",
+    "golos": "WUBRG",
+    "chulane": "GWU",
+}
+
+if os.path.exists(COMMANDER_COLORS_FILE):
+    with open(COMMANDER_COLORS_FILE, 'r', encoding='utf-8') as f:
+        COMMANDER_COLORS.update({k.lower(): v.upper() for k, v in json.load(f).items()})
+
+# Una sola alternación (claves más largas primero) en vez de un if/elif por comandante
+_COMMANDER_KEY_RE = re.compile(
+    "|".join(map(re.escape, sorted(COMMANDER_COLORS, key=len, reverse=True)))
+)
+
+
+@functools.lru_cache(maxsize=1024)
 def guess_colors_from_name(commander_name):
     """
     Intenta adivinar colores basándose en palabras clave en el nombre
@@ -201,76 +320,145 @@ def guess_colors_from_name(commander_name):
     name_lower = commander_name.lower()
     
     # Patrones comunes
-    if "atraxa" in name_lower:
-        return ["W", "U", "B", "G"]  # WUBG
-    elif "muldrotha" in name_lower:
-        return ["U", "B", "G"]  # UBG
-    elif "korvold" in name_lower:
-        return ["B", "R", "G"]  # BRG
-    elif "golos" in name_lower:
-        return ["W", "U", "B", "R", "G"]  # WUBRG
-    elif "chulane" in name_lower:
-        return ["G", "W", "U"]  # GWU
+    match = _COMMANDER_KEY_RE.search(name_lower)
+    if match:
+        return list(COMMANDER_COLORS[match.group(0)])
     
     # Si no lo conocemos, asumir 5 colores (permisivo)
     print(f"      ⚠️  Colores desconocidos para '{commander_name}', asumiendo 5 colores")
     return ["W", "U", "B", "R", "G"]
 
 
-def card_is_legal_in_colors(card_name, commander_colors, inventory):
+def index_color_identity(index, card):
     """
-    Verifica si una carta es legal en la identidad de colores del comandante
-    Usa Scryfall API para obtener la identidad de la carta
+    Agrega una carta de Scryfall al índice nombre_carta -> identidad de colores
     """
-    # Si no tenemos colores del comandante, aceptar todo
-    if not commander_colors:
-        return True
+    name_lower = card["name"].lower()
+    colors = frozenset(card.get("color_identity", []))
+    index[name_lower] = colors
     
-    # Normalizar colores del comandante
-    commander_colors_set = set(c.upper() for c in commander_colors)
+    # Cartas de dos caras: indexar también cada cara por separado
+    if " // " in name_lower:
+        for face in name_lower.split(" // "):
+            index.setdefault(face, colors)
+
+
+@functools.lru_cache(maxsize=None)
+def load_scryfall_oracle():
+    """
+    Carga el índice nombre_carta -> identidad de colores
+    Se construye desde el bulk "oracle_cards" de Scryfall y se guarda en
+    disco (pickle) para no volver a descargarlo hasta que caduque
+    """
+    path = Path(SCRYFALL_ORACLE_FILE)
+    
+    if path.exists() and time.time() - path.stat().st_mtime < SCRYFALL_ORACLE_TTL:
+        try:
+            return pickle.loads(path.read_bytes())
+        except Exception:
+            pass  # Pickle truncado o ilegible: se reconstruye el índice
     
-    # Buscar en caché primero
-    card_lower = card_name.lower()
+    print(f"   📥 Descargando bulk data de Scryfall (oracle cards)...")
     
-    # Consultar Scryfall para obtener color identity
     try:
-        import urllib.parse
-        encoded = urllib.parse.quote(card_name)
-        url = f"https://api.scryfall.com/cards/named?exact={encoded}"
-        
-        r = SESSION.get(url, timeout=5)
-        if r.status_code == 200:
-            data = r.json()
-            card_colors = data.get("color_identity", [])
-            
-            # Verificar si la carta es legal
-            card_colors_set = set(card_colors)
-            is_legal = card_colors_set.issubset(commander_colors_set)
-            
-            return is_legal
+        r = SESSION.get("https://api.scryfall.com/bulk-data", timeout=10)
+        uri = next(b["download_uri"] for b in json_loads(r.content)["data"] if b["type"] == "oracle_cards")
+        cards = json_loads(SESSION.get(uri, timeout=120).content)
+    except Exception as e:
+        print(f"   ⚠️  No se pudo descargar el bulk de Scryfall: {e}")
+        return {}
+    
+    oracle = {}
+    for card in cards:
+        index_color_identity(oracle, card)
+    
+    # Escritura atómica: un corte a mitad no deja un pickle truncado que parezca vigente
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(pickle.dumps(oracle, protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp, path)
+        print(f"   ✅ {len(oracle)} cartas indexadas en {SCRYFALL_ORACLE_FILE}")
+    except OSError:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+        print(f"   ✅ {len(oracle)} cartas indexadas (sin guardar en {SCRYFALL_ORACLE_FILE})")
+    
+    return oracle
+
+
+def fetch_color_identities(card_names):
+    """
+    Obtiene la identidad de colores de varias cartas a la vez
+    Usa el índice local de Scryfall; las que falten se piden en lotes
+    vía POST /cards/collection (hasta 75 cartas por petición)
+    Retorna dict: {nombre_carta_lower: frozenset de colores}
+    """
+    oracle = load_scryfall_oracle()
+    card_colors = {}
+    pending = []
+    
+    for card_name in dict.fromkeys(card_names):
+        card_lower = card_name.lower()
+        if card_lower in oracle:
+            card_colors[card_lower] = oracle[card_lower]
+        else:
+            pending.append(card_name)
+    
+    for start in range(0, len(pending), SCRYFALL_BATCH_SIZE):
+        batch = pending[start:start + SCRYFALL_BATCH_SIZE]
         
-        # Si falla Scryfall, asumir legal (permisivo)
-        return True
+        try:
+            r = SESSION.post(
+                "https://api.scryfall.com/cards/collection",
+                json={"identifiers": [{"name": n} for n in batch]},
+                timeout=30
+            )
+            if r.status_code == 200:
+                for card in json_loads(r.content).get("data", []):
+                    index_color_identity(card_colors, card)
+        except Exception as e:
+            print(f"      ⚠️  Error consultando Scryfall: {e}")
         
-    except Exception as e:
-        # En caso de error, asumir legal
-        return True
+        time.sleep(COLOR_CHECK_RATE_LIMIT)
+    
+    return card_colors
 
 
 # =========================
 # 4. SLUG
 # =========================
+@functools.lru_cache(maxsize=8192)
 def slug(s: str) -> str:
-    import unicodedata
     s = unicodedata.normalize('NFD', s)
     s = ''.join(char for char in s if unicodedata.category(char) != 'Mn')
-    s = s.lower()
-    s = s.replace("'","").replace("'","").replace("â€™","")
-    s = s.replace(",","").replace(":","").replace(".","")
-    s = re.sub(r"[^a-z0-9]+","-",s)
+    s = s.lower().translate(_SLUG_DROP)
+    s = _SLUG_RE.sub("-", s)
     return s.strip("-")
 
 
+# =========================
+# 4B. RECORRER JSON
+# =========================
+def walk_json(data):
+    """
+    Recorre un JSON anidado y produce cada dict encontrado
+    DFS iterativo (sin recursión) en el mismo orden que un recorrido recursivo
+    """
+    stack = [data]
+    pop = stack.pop
+    extend = stack.extend
+    
+    while stack:
+        obj = pop()
+        if isinstance(obj, dict):
+            yield obj
+            extend(reversed(obj.values()))
+        elif isinstance(obj, list):
+            extend(reversed(obj))
+
+
 # =========================
 # 5. OBTENER AVERAGE DECK Y BUDGET + SCRYFALL
 # =========================
@@ -282,17 +470,21 @@ def get_average_and_budget_deck(commander_name):
     url = f"https://json.edhrec.com/pages/average-decks/{slug(commander_name)}.json"
     
     try:
-        r = SESSION.get(url, timeout=10)
-        if r.status_code != 200:
+        data = fetch_json(url)
+        if data is None:
             return {}
-        
-        data = r.json()
     except:
         return {}
     
     cards_info = {}
     
-    def scan(obj, in_budget_section=False):
+    # DFS iterativo; cada nodo lleva si está dentro de una sección budget
+    stack = [(data, False)]
+    pop = stack.pop
+    
+    while stack:
+        obj, in_budget_section = pop()
+        
         if isinstance(obj, dict):
             # Detectar sección budget
             is_budget = "budget" in str(obj.get("tag", "")).lower() or in_budget_section
@@ -330,20 +522,18 @@ def get_average_and_budget_deck(commander_name):
                     
                     cards_info[name_lower]["is_budget"] = cards_info[name_lower]["is_budget"] or is_budget
             
-            for v in obj.values():
-                scan(v, is_budget)
+            stack.extend((v, is_budget) for v in reversed(obj.values()))
         
         elif isinstance(obj, list):
-            for item in obj:
-                scan(item, in_budget_section)
+            stack.extend((item, in_budget_section) for item in reversed(obj))
     
-    scan(data)
     return cards_info
 
 
 # =========================
 # 6. OBTENER SINERGIAS CARTA A CARTA + SCRYFALL
 # =========================
+@functools.lru_cache(maxsize=4096)
 def get_card_synergies(card_name):
     """
     Obtiene cartas que tienen sinergia con esta carta
@@ -352,78 +542,48 @@ def get_card_synergies(card_name):
     url = f"https://json.edhrec.com/pages/cards/{slug(card_name)}.json"
     
     try:
-        r = SESSION.get(url, timeout=10)
-        if r.status_code not in [200, 403, 404]:
+        data = fetch_json(url)
+        if data is None:
             return {}
-        if r.status_code != 200:
-            return {}
-        
-        data = r.json()
     except:
         return {}
     
     synergies = {}
     
-    # Buscar el scryfall del objetivo (la carta que estamos analizando)
-    target_scryfall = find_scryfall_in_data(data, card_name)
-    
-    def scan(obj):
-        if isinstance(obj, dict):
-            # Buscar secciones de sinergia
-            if "cardviews" in obj:
-                for card in obj["cardviews"]:
-                    name = card.get("name")
-                    synergy = card.get("synergy", 0)
-                    scryfall = card.get("scryfall_uri", "")
-                    
-                    if name and synergy > MIN_SYNERGY_SCORE:
-                        synergies[name.lower()] = {
-                            "synergy": synergy,
-                            "scryfall": scryfall
-                        }
-            
-            for v in obj.values():
-                scan(v)
-        elif isinstance(obj, list):
-            for item in obj:
-                scan(item)
+    # Un solo recorrido del JSON: índice de todas las cartas de la página
+    for name_lower, card in index_cardviews(data).items():
+        synergy = card.get("synergy", 0)
+        
+        if synergy > MIN_SYNERGY_SCORE:
+            synergies[name_lower] = {
+                "synergy": synergy,
+                "scryfall": card.get("scryfall_uri", "")
+            }
     
-    scan(data)
     return synergies
 
 
 # =========================
-# 6B. BUSCAR SCRYFALL EN DATA
+# 6B. INDEXAR CARTAS DEL JSON
 # =========================
-def find_scryfall_in_data(data, card_name):
+def index_cardviews(data):
     """
-    Busca el link de Scryfall para una carta específica en los datos de EDHREC
+    Recorre el JSON de EDHREC una sola vez e indexa cada carta de las
+    secciones "cardviews" por nombre
+    Retorna dict: {nombre_carta_lower: cardview}
     """
+    index = {}
     if data is None:
-        return ""
+        return index
     
-    target = card_name.lower()
-    found = ""
+    for obj in walk_json(data):
+        if "cardviews" in obj:
+            for card in obj["cardviews"]:
+                name = card.get("name")
+                if name:
+                    index[name.lower()] = card
     
-    def scan(obj):
-        nonlocal found
-        if found:
-            return
-        
-        if isinstance(obj, dict):
-            if obj.get("name") and obj["name"].lower() == target:
-                if "scryfall_uri" in obj:
-                    found = obj["scryfall_uri"]
-                    return
-            
-            for v in obj.values():
-                scan(v)
-        elif isinstance(obj, list):
-            for item in obj:
-                scan(item)
-    
-    scan(data)
-    return found
+    return index
 
 
 # =========================
@@ -447,7 +607,7 @@ def analyze_and_complete_deck(deck, inventory, commander_colors):
     Analiza un mazo parcial y sugiere cartas del inventario
     """
     commander = deck["commander"]
-    current_cards = [c.lower() for c in deck["cards"]]
+    current_cards = deck["cards_lower"]
     current_cards_set = set(current_cards)
     
     print(f"\n{'='*70}")
@@ -457,25 +617,32 @@ def analyze_and_complete_deck(deck, inventory, commander_colors):
     print(f"   Cartas faltantes: {64 - len(current_cards)}")
     print(f"   Colores: {', '.join(commander_colors) if commander_colors else 'Desconocidos'}")
     
-    # 1. Obtener recomendaciones de EDHREC
-    print(f"\n📊 Consultando EDHREC average/budget deck...")
-    edhrec_cards = get_average_and_budget_deck(commander)
-    time.sleep(RATE_LIMIT)
+    # Puntuación acumulada y link de Scryfall por carta, en dicts separados
+    synergy_scores = Counter()
+    scryfall_map = {}
     
-    # 2. Calcular sinergias con cartas actuales
-    print(f"🔗 Calculando sinergias con {len(current_cards)} cartas actuales...")
-    all_synergies = defaultdict(lambda: {"score": 0.0, "scryfall": ""})
+    # Deduplicar (conservando el orden) y limitar a 20 para no tardar mucho
+    cards_for_synergy = list(dict.fromkeys(current_cards))[:20]
     
-    for idx, card in enumerate(current_cards[:20], 1):  # Limitar a 20 para no tardar mucho
-        print(f"   [{idx}/20] Sinergias de: {card}")
-        synergies = get_card_synergies(card)
+    # Descargar en paralelo (I/O), combinar en orden en el hilo principal
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # 1. Obtener recomendaciones de EDHREC (en paralelo con las sinergias)
+        print(f"\n📊 Consultando EDHREC average/budget deck...")
+        edhrec_future = executor.submit(get_average_and_budget_deck, commander)
         
-        for synergy_card, data in synergies.items():
-            all_synergies[synergy_card]["score"] += data["synergy"]
-            if data["scryfall"] and not all_synergies[synergy_card]["scryfall"]:
-                all_synergies[synergy_card]["scryfall"] = data["scryfall"]
+        # 2. Calcular sinergias con cartas actuales
+        print(f"🔗 Calculando sinergias con {len(current_cards)} cartas actuales...")
+        fetched = executor.map(get_card_synergies, cards_for_synergy)
         
-        time.sleep(RATE_LIMIT)
+        for idx, (card, synergies) in enumerate(zip(cards_for_synergy, fetched), 1):
+            print(f"   [{idx}/20] Sinergias de: {card}")
+            
+            for synergy_card, data in synergies.items():
+                synergy_scores[synergy_card] += data["synergy"]
+                if data["scryfall"] and synergy_card not in scryfall_map:
+                    scryfall_map[synergy_card] = data["scryfall"]
+        
+        edhrec_cards = edhrec_future.result()
     
     # 3. Compilar sugerencias CON VERIFICACIÓN DE COLORES
     suggestions = []
@@ -484,51 +651,82 @@ def analyze_and_complete_deck(deck, inventory, commander_colors):
     print(f"\n🎨 Filtrando cartas por identidad de colores...")
     print(f"   Colores del comandante: {commander_colors}")
     
-    # Crear lista de cartas a verificar
-    cards_to_check = []
-    
-    for card_lower, info in edhrec_cards.items():
-        if card_lower in current_cards_set:
-            continue
-        if card_lower not in inventory:
-            # Cartas clave faltantes (no verificar colores, solo informar)
-            inclusion_pct = info.get("inclusion", 0) / info.get("num_decks", 1) if info.get("num_decks", 0) > 0 else 0
-            price = info.get("price", 999)
-            
-            if inclusion_pct >= KEY_CARD_INCLUSION_MIN and price <= KEY_CARD_PRICE_MAX:
-                scryfall_url = info.get("scryfall", "")
-                if not scryfall_url:
-                    scryfall_url = generate_scryfall_url(info["name"])
-                
-                key_cards_missing.append({
-                    "name": info["name"],
-                    "inclusion": inclusion_pct,
-                    "price": price,
-                    "num_decks": info.get("num_decks", 0),
-                    "scryfall": scryfall_url
-                })
-            continue
-        
-        cards_to_check.append(("edhrec", card_lower, info))
+    # Calcular scores de las cartas EDHREC por columnas (vectorizado)
+    edhrec_df = pd.DataFrame.from_dict(edhrec_cards, orient="index")
+    if not edhrec_df.empty:
+        edhrec_df = edhrec_df[~edhrec_df.index.isin(current_cards_set)]
     
-    # Agregar cartas de sinergia a verificar
-    for card_lower, syn_data in all_synergies.items():
-        if card_lower in current_cards_set:
-            continue
-        if card_lower in edhrec_cards:
-            continue
-        if card_lower not in inventory:
-            continue
+    if edhrec_df.empty:
+        edhrec_candidates = edhrec_df
+    else:
+        num_decks = edhrec_df["num_decks"]
+        edhrec_df["inclusion_pct"] = (edhrec_df["inclusion"] / num_decks.where(num_decks > 0)).fillna(0.0)
+        edhrec_df["synergy_score"] = edhrec_df.index.map(synergy_scores).fillna(0.0)
+        edhrec_df["score"] = (
+            edhrec_df["inclusion_pct"] * 100 +
+            (edhrec_df["synergy_score"] * 10).clip(upper=50) +
+            edhrec_df["is_budget"].astype(int) * 10
+        )
+        owned = edhrec_df.index.isin(list(inventory))
         
-        synergy_score = syn_data.get("score", 0)
-        combined_score = min(synergy_score * 10, 50)
+        # Cartas clave faltantes (no verificar colores, solo informar)
+        missing = edhrec_df[~owned]
+        missing = missing[
+            (missing["inclusion_pct"] >= KEY_CARD_INCLUSION_MIN) &
+            (missing["price"] <= KEY_CARD_PRICE_MAX)
+        ]
+        for info in missing.to_dict("records"):
+            key_cards_missing.append({
+                "name": info["name"],
+                "inclusion": info["inclusion_pct"],
+                "price": info["price"],
+                "num_decks": info["num_decks"],
+                "scryfall": info["scryfall"] or generate_scryfall_url(info["name"])
+            })
         
-        if combined_score > MIN_SCORE_THRESHOLD:
-            cards_to_check.append(("synergy", card_lower, syn_data))
+        edhrec_candidates = edhrec_df[owned & (edhrec_df["score"] >= MIN_SCORE_THRESHOLD)]
+    
+    # Cartas de sinergia que tienes y no están ya en el mazo ni en EDHREC
+    synergy_series = pd.Series(synergy_scores, dtype=float)
+    if not synergy_series.empty:
+        index = synergy_series.index
+        synergy_series = synergy_series[
+            ~index.isin(current_cards_set) &
+            ~index.isin(list(edhrec_cards)) &
+            index.isin(list(inventory))
+        ]
+        synergy_series = synergy_series[(synergy_series * 10).clip(upper=50) > MIN_SCORE_THRESHOLD]
+    
+    # Crear lista de cartas a verificar
+    cards_to_check = [
+        ("edhrec", card_lower, info)
+        for card_lower, info in zip(edhrec_candidates.index, edhrec_candidates.to_dict("records"))
+    ]
+    cards_to_check += [
+        ("synergy", card_lower, synergy_score)
+        for card_lower, synergy_score in synergy_series.items()
+    ]
     
     print(f"   Verificando {len(cards_to_check)} cartas...")
     
-    # Verificar colores en lotes
+    card_names = [
+        data["name"] if source_type == "edhrec" else inventory[card_lower]["name"]
+        for source_type, card_lower, data in cards_to_check
+    ]
+    
+    # Verificar colores de todas las cartas a la vez (índice local + lotes)
+    if CHECK_COLOR_IDENTITY and commander_colors:
+        commander_colors_set = set(c.upper() for c in commander_colors)
+        card_colors = fetch_color_identities(card_names)
+        
+        # Si Scryfall no conoce la carta, asumir legal (permisivo)
+        legality = [
+            card_colors.get(name.lower(), frozenset()).issubset(commander_colors_set)
+            for name in card_names
+        ]
+    else:
+        legality = [True] * len(card_names)
+    
     legal_count = 0
     illegal_count = 0
     
@@ -536,60 +734,37 @@ def analyze_and_complete_deck(deck, inventory, commander_colors):
         if idx % 10 == 0:
             print(f"   [{idx}/{len(cards_to_check)}] Legal: {legal_count}, Ilegal: {illegal_count}")
         
-        card_name = data["name"] if source_type == "edhrec" else inventory[card_lower]["name"]
-        
-        # Verificar colores
-        if CHECK_COLOR_IDENTITY and commander_colors:
-            is_legal = card_is_legal_in_colors(card_name, commander_colors, inventory)
-            time.sleep(COLOR_CHECK_RATE_LIMIT)
-            
-            if not is_legal:
-                illegal_count += 1
-                continue
+        # Descartar cartas fuera de la identidad de colores
+        if not legality[idx - 1]:
+            illegal_count += 1
+            continue
         
         legal_count += 1
         
-        # Calcular score y agregar
+        # Agregar con el score ya calculado
         if source_type == "edhrec":
             info = data
-            inclusion_pct = info.get("inclusion", 0) / info.get("num_decks", 1) if info.get("num_decks", 0) > 0 else 0
-            synergy_score = all_synergies.get(card_lower, {}).get("score", 0)
-            synergy_scryfall = all_synergies.get(card_lower, {}).get("scryfall", "")
-            is_budget = info.get("is_budget", False)
-            
-            combined_score = (
-                inclusion_pct * 100 +
-                min(synergy_score * 10, 50) +
-                (10 if is_budget else 0)
-            )
             
-            if combined_score < MIN_SCORE_THRESHOLD:
-                continue
-            
-            scryfall_url = info.get("scryfall", "") or synergy_scryfall
+            scryfall_url = info["scryfall"] or scryfall_map.get(card_lower, "")
             if not scryfall_url:
                 scryfall_url = generate_scryfall_url(info["name"])
             
             suggestions.append({
                 "name": info["name"],
-                "score": combined_score,
-                "inclusion": inclusion_pct,
-                "synergy": synergy_score,
-                "is_budget": is_budget,
+                "score": info["score"],
+                "inclusion": info["inclusion_pct"],
+                "synergy": info["synergy_score"],
+                "is_budget": info["is_budget"],
                 "source": "EDHREC",
                 "collections": "; ".join(inventory[card_lower]["collections"]),
                 "scryfall": scryfall_url
             })
         
         else:  # synergy
-            syn_data = data
-            synergy_score = syn_data.get("score", 0)
+            synergy_score = data
             combined_score = min(synergy_score * 10, 50)
             
-            if combined_score < MIN_SCORE_THRESHOLD:
-                continue
-            
-            scryfall_url = syn_data.get("scryfall", "")
+            scryfall_url = scryfall_map.get(card_lower, "")
             if not scryfall_url:
                 scryfall_url = generate_scryfall_url(inventory[card_lower]["name"])
             
@@ -606,186 +781,242 @@ def analyze_and_complete_deck(deck, inventory, commander_colors):
     
     print(f"   ✅ Verificación completa: {legal_count} legales, {illegal_count} ilegales")
     
-    # Ordenar sugerencias
-    suggestions.sort(key=lambda x: x["score"], reverse=True)
-    key_cards_missing.sort(key=lambda x: x["inclusion"], reverse=True)
-    
+    # Quedarse solo con las mejores (top-N sin ordenar la lista completa)
     return {
         "commander": commander,
         "current_size": len(current_cards),
         "cards_needed": 64 - len(current_cards),
-        "suggestions": suggestions[:MAX_SUGGESTIONS],
-        "key_cards_missing": key_cards_missing[:20]
+        "suggestions": heapq.nlargest(MAX_SUGGESTIONS, suggestions, key=itemgetter("score")),
+        "key_cards_missing": heapq.nlargest(20, key_cards_missing, key=itemgetter("inclusion"))
     }
 
 
 # =========================
 # 8. GENERAR REPORTE
 # =========================
-def generate_completion_report(analysis_results):
+def build_report_frame(analysis_results, key, columns):
     """
-    Genera archivos de texto y Excel con las sugerencias
+    Concatena en un solo DataFrame las listas `result[key]` de cada comandante
+    columns: {clave_del_dict: nombre_de_columna} (define también el orden)
     """
-    import os
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
+    frames = []
     for result in analysis_results:
-        commander = result["commander"]
-        safe_name = slug(commander)
+        if not result[key]:
+            continue
         
-        # Archivo de texto
-        txt_file = os.path.join(OUTPUT_DIR, f"{safe_name}_sugerencias.txt")
+        sub = pd.DataFrame(result[key], columns=list(columns)).rename(columns=columns)
+        sub.insert(0, "Comandante", result["commander"])
+        frames.append(sub)
+    
+    if not frames:
+        return pd.DataFrame()
+    
+    df = pd.concat(frames, ignore_index=True)
+    df["Scryfall"] = df["Scryfall"].fillna("")
+    return df
+
+
+def excel_rows(df):
+    """Filas de df como tuplas de escalares de Python (None en lugar de NaN/inf)"""
+    df = df.replace([float("inf"), float("-inf")], float("nan"))
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def write_card_cell(ws, row, col, card_name, url, hyper_fmt, links_added):
+    """
+    Escribe el nombre de la carta con hipervínculo a url (si hay url y la hoja
+    no llegó al límite de Excel); si xlsxwriter rechaza el link (URL demasiado
+    larga o límite alcanzado) se escribe el nombre como texto
+    Retorna el número de hipervínculos escritos en la hoja
+    """
+    if url and links_added < MAX_SHEET_HYPERLINKS:
+        if ws.write_url(row, col, url, hyper_fmt, string=card_name) == 0:
+            return links_added + 1
+    
+    ws.write_string(row, col, card_name)
+    return links_added
+
+
+def write_suggestions_txt(result, out_dir):
+    """
+    Escribe el archivo de texto con las sugerencias de un comandante
+    Retorna la ruta del archivo generado
+    """
+    commander = result["commander"]
+    safe_name = slug(commander)
+    
+    # Archivo de texto
+    txt_file = out_dir / f"{safe_name}_sugerencias.txt"
+    
+    # Acumular todo el texto y escribirlo con una sola llamada a write()
+    parts = []
+    append = parts.append
+    
+    append(f"# SUGERENCIAS PARA COMPLETAR: {commander}\n")
+    append(f"# Cartas actuales: {result['current_size']}\n")
+    append(f"# Cartas necesarias: {result['cards_needed']}\n\n")
+    
+    # Sugerencias
+    append(f"## CARTAS SUGERIDAS DE TU INVENTARIO ({len(result['suggestions'])})\n")
+    append(f"## Top {MAX_SUGGESTIONS} ordenadas por relevancia\n\n")
+    
+    for idx, card in enumerate(result["suggestions"], 1):
+        budget_mark = " 💰" if card["is_budget"] else ""
+        synergy_mark = " 🔗" if card["synergy"] > 0.3 else ""
         
-        with open(txt_file, 'w', encoding='utf-8') as f:
-            f.write(f"# SUGERENCIAS PARA COMPLETAR: {commander}\n")
-            f.write(f"# Cartas actuales: {result['current_size']}\n")
-            f.write(f"# Cartas necesarias: {result['cards_needed']}\n\n")
-            
-            # Sugerencias
-            f.write(f"## CARTAS SUGERIDAS DE TU INVENTARIO ({len(result['suggestions'])})\n")
-            f.write(f"## Top {MAX_SUGGESTIONS} ordenadas por relevancia\n\n")
-            
-            for idx, card in enumerate(result["suggestions"], 1):
-                budget_mark = " 💰" if card["is_budget"] else ""
-                synergy_mark = " 🔗" if card["synergy"] > 0.3 else ""
-                
-                f.write(f"{idx:2d}. {card['name']}{budget_mark}{synergy_mark}\n")
-                f.write(f"    Score: {card['score']:.1f} | ")
-                f.write(f"Inclusión: {card['inclusion']:.1%} | ")
-                f.write(f"Sinergia: {card['synergy']:.2f} | ")
-                f.write(f"Fuente: {card['source']}\n")
-                f.write(f"    Colecciones: {card['collections']}\n")
-                if card.get("scryfall"):
-                    f.write(f"    Scryfall: {card['scryfall']}\n")
-                f.write("\n")
-            
-            # Cartas clave faltantes
-            if result["key_cards_missing"]:
-                f.write(f"\n## ⚠️  CARTAS CLAVE QUE NO TIENES (deberías comprar)\n")
-                f.write(f"## Inclusión >40%, Precio <$2 USD\n\n")
-                
-                for idx, card in enumerate(result["key_cards_missing"], 1):
-                    f.write(f"{idx:2d}. {card['name']}\n")
-                    f.write(f"    Inclusión: {card['inclusion']:.1%} | ")
-                    f.write(f"Precio: ${card['price']:.2f} | ")
-                    f.write(f"En {card['num_decks']} decks\n")
-                    if card.get("scryfall"):
-                        f.write(f"    Scryfall: {card['scryfall']}\n")
-                    f.write("\n")
-            
-            f.write("\n## LEYENDA\n")
-            f.write("# 💰 = Carta aparece en Budget EDHREC\n")
-            f.write("# 🔗 = Alta sinergia con cartas actuales del mazo\n")
-            f.write("# Score = Combinación de inclusión, sinergia y budget\n")
+        append(f"{idx:2d}. {card['name']}{budget_mark}{synergy_mark}\n")
+        append(
+            f"    Score: {card['score']:.1f} | "
+            f"Inclusión: {card['inclusion']:.1%} | "
+            f"Sinergia: {card['synergy']:.2f} | "
+            f"Fuente: {card['source']}\n"
+        )
+        append(f"    Colecciones: {card['collections']}\n")
+        if card.get("scryfall"):
+            append(f"    Scryfall: {card['scryfall']}\n")
+        append("\n")
+    
+    # Cartas clave faltantes
+    if result["key_cards_missing"]:
+        append(f"\n## ⚠️  CARTAS CLAVE QUE NO TIENES (deberías comprar)\n")
+        append(f"## Inclusión >40%, Precio <$2 USD\n\n")
         
-        print(f"   ✅ {txt_file}")
+        for idx, card in enumerate(result["key_cards_missing"], 1):
+            append(f"{idx:2d}. {card['name']}\n")
+            append(
+                f"    Inclusión: {card['inclusion']:.1%} | "
+                f"Precio: ${card['price']:.2f} | "
+                f"En {card['num_decks']} decks\n"
+            )
+            if card.get("scryfall"):
+                append(f"    Scryfall: {card['scryfall']}\n")
+            append("\n")
     
-    # Excel consolidado
-    excel_file = os.path.join(OUTPUT_DIR, "todas_sugerencias.xlsx")
+    append("\n## LEYENDA\n")
+    append("# 💰 = Carta aparece en Budget EDHREC\n")
+    append("# 🔗 = Alta sinergia con cartas actuales del mazo\n")
+    append("# Score = Combinación de inclusión, sinergia y budget\n")
     
-    excel_data = []
-    for result in analysis_results:
-        for card in result["suggestions"]:
-            excel_data.append({
-                "Comandante": result["commander"],
-                "Carta": card["name"],
-                "Score": card["score"],
-                "Inclusión %": card["inclusion"],
-                "Sinergia": card["synergy"],
-                "Budget": "Sí" if card["is_budget"] else "No",
-                "Fuente": card["source"],
-                "Colecciones": card["collections"],
-                "Scryfall": card.get("scryfall", "")
-            })
+    with open(txt_file, 'w', encoding='utf-8') as f:
+        f.write("".join(parts))
     
-    df_suggestions = pd.DataFrame(excel_data)
+    return txt_file
+
+
+def generate_completion_report(analysis_results):
+    """
+    Genera archivos de texto y Excel con las sugerencias
+    """
+    out_dir = Path(OUTPUT_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
     
-    # Cartas clave faltantes
-    key_cards_data = []
-    for result in analysis_results:
-        for card in result["key_cards_missing"]:
-            key_cards_data.append({
-                "Comandante": result["commander"],
-                "Carta": card["name"],
-                "Inclusión %": card["inclusion"],
-                "Precio USD": card["price"],
-                "# Decks": card["num_decks"],
-                "Scryfall": card.get("scryfall", "")
-            })
+    # Un archivo independiente por comandante: se escriben en paralelo
+    # y se reportan en orden en el hilo principal
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        txt_files = executor.map(
+            write_suggestions_txt, analysis_results, [out_dir] * len(analysis_results)
+        )
+        for txt_file in txt_files:
+            print(f"   ✅ {txt_file}")
     
-    df_key_cards = pd.DataFrame(key_cards_data)
+    # Excel consolidado
+    excel_file = out_dir / "todas_sugerencias.xlsx"
     
-    with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
-        if not df_suggestions.empty:
-            df_suggestions.to_excel(writer, sheet_name='Sugerencias', index=False)
-        
-        if not df_key_cards.empty:
-            df_key_cards.to_excel(writer, sheet_name='Cartas Clave Faltantes', index=False)
+    # Un DataFrame por comandante construido directo de sus listas de dicts,
+    # concatenados al final (columnas homogéneas, sin dicts intermedios por fila)
+    suggestion_columns = {
+        "name": "Carta",
+        "score": "Score",
+        "inclusion": "Inclusión %",
+        "synergy": "Sinergia",
+        "is_budget": "Budget",
+        "source": "Fuente",
+        "collections": "Colecciones",
+        "scryfall": "Scryfall",
+    }
+    key_card_columns = {
+        "name": "Carta",
+        "inclusion": "Inclusión %",
+        "price": "Precio USD",
+        "num_decks": "# Decks",
+        "scryfall": "Scryfall",
+    }
+    
+    # (Budget queda como bool: el texto Sí/No y su color se deciden al escribir la celda)
+    df_suggestions = build_report_frame(analysis_results, "suggestions", suggestion_columns)
     
-    # Aplicar hipervínculos
-    from openpyxl import load_workbook
-    from openpyxl.styles import PatternFill
+    # Cartas clave faltantes
+    df_key_cards = build_report_frame(analysis_results, "key_cards_missing", key_card_columns)
     
-    wb = load_workbook(excel_file)
+    # Escribir y dar formato en una sola pasada, fila a fila y sin pasar por to_excel
+    # (constant_memory: cada fila se vuelca a disco al empezar la siguiente;
+    #  strings_to_urls=False: la columna Scryfall queda como texto, el link va en la carta)
+    workbook = xlsxwriter.Workbook(excel_file, {"constant_memory": True, "strings_to_urls": False})
+    
+    # Formatos creados una sola vez y reutilizados en todas las celdas
+    header_fmt = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+    budget_fmt = workbook.add_format({"bg_color": "#FFF2CC"})
+    high_synergy_fmt = workbook.add_format({"bg_color": "#E6F3FF"})
+    high_inclusion_fmt = workbook.add_format({"bg_color": "#FFCCCC"})
+    hyper_fmt = workbook.add_format({"font_color": "blue", "underline": 1})
     
     # Hoja de sugerencias
-    if 'Sugerencias' in wb.sheetnames:
-        ws = wb['Sugerencias']
-        
-        # Colores para budget
-        budget_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-        high_synergy_fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+    if not df_suggestions.empty:
+        ws = workbook.add_worksheet('Sugerencias')
+        ws.write_row(0, 0, df_suggestions.columns, header_fmt)
         
         hyperlinks_added = 0
-        for r in range(2, ws.max_row + 1):
-            # Hipervínculo a Scryfall (columna I)
-            scryfall_url = ws[f'I{r}'].value
-            if scryfall_url and isinstance(scryfall_url, str) and scryfall_url.startswith('http'):
-                try:
-                    ws[f'B{r}'].hyperlink = scryfall_url
-                    ws[f'B{r}'].style = "Hyperlink"
-                    hyperlinks_added += 1
-                except Exception as e:
-                    print(f"      ⚠️  Error agregando hyperlink en fila {r}: {e}")
+        for r, row in enumerate(excel_rows(df_suggestions), 1):
+            (commander, card_name, score, inclusion, synergy,
+             is_budget, source, collections, scryfall_url) = row
             
-            # Color para cartas budget (columna F)
-            is_budget = ws[f'F{r}'].value
-            if is_budget == "Sí":
-                ws[f'F{r}'].fill = budget_fill
+            # Cada celda se escribe una sola vez, con su formato decidido desde el dato
+            ws.write(r, 0, commander)
+            
+            # Hipervínculo a Scryfall (columna B)
+            url = scryfall_url if isinstance(scryfall_url, str) and scryfall_url.startswith('http') else None
+            hyperlinks_added = write_card_cell(ws, r, 1, card_name, url, hyper_fmt, hyperlinks_added)
+            
+            ws.write_row(r, 2, (score, inclusion))
             
             # Color para alta sinergia (columna E)
-            synergy = ws[f'E{r}'].value
-            if isinstance(synergy, (int, float)) and synergy > 0.5:
-                ws[f'E{r}'].fill = high_synergy_fill
+            high_synergy = synergy is not None and synergy > 0.5
+            ws.write(r, 4, synergy, high_synergy_fmt if high_synergy else None)
+            
+            # Color para cartas budget (columna F)
+            if is_budget:
+                ws.write_string(r, 5, "Sí", budget_fmt)
+            else:
+                ws.write_string(r, 5, "No")
+            
+            ws.write_row(r, 6, (source, collections, scryfall_url))
         
         print(f"      📎 {hyperlinks_added} hipervínculos agregados en Sugerencias")
     
     # Hoja de cartas clave
-    if 'Cartas Clave Faltantes' in wb.sheetnames:
-        ws = wb['Cartas Clave Faltantes']
-        
-        high_inclusion_fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
+    if not df_key_cards.empty:
+        ws = workbook.add_worksheet('Cartas Clave Faltantes')
+        ws.write_row(0, 0, df_key_cards.columns, header_fmt)
         
         hyperlinks_added = 0
-        for r in range(2, ws.max_row + 1):
-            # Hipervínculo a Scryfall (columna F)
-            scryfall_url = ws[f'F{r}'].value
-            if scryfall_url and isinstance(scryfall_url, str) and scryfall_url.startswith('http'):
-                try:
-                    ws[f'B{r}'].hyperlink = scryfall_url
-                    ws[f'B{r}'].style = "Hyperlink"
-                    hyperlinks_added += 1
-                except Exception as e:
-                    print(f"      ⚠️  Error agregando hyperlink en fila {r}: {e}")
+        for r, row in enumerate(excel_rows(df_key_cards), 1):
+            commander, card_name, inclusion, price, num_decks, scryfall_url = row
+            
+            ws.write(r, 0, commander)
+            
+            # Hipervínculo a Scryfall (columna B)
+            url = scryfall_url if isinstance(scryfall_url, str) and scryfall_url.startswith('http') else None
+            hyperlinks_added = write_card_cell(ws, r, 1, card_name, url, hyper_fmt, hyperlinks_added)
             
             # Color para alta inclusión (columna C)
-            inclusion = ws[f'C{r}'].value
-            if isinstance(inclusion, (int, float)) and inclusion > 0.5:
-                ws[f'C{r}'].fill = high_inclusion_fill
+            high_inclusion = inclusion is not None and inclusion > 0.5
+            ws.write(r, 2, inclusion, high_inclusion_fmt if high_inclusion else None)
+            
+            ws.write_row(r, 3, (price, num_decks, scryfall_url))
         
         print(f"      📎 {hyperlinks_added} hipervínculos agregados en Cartas Clave")
     
-    wb.save(excel_file)
+    workbook.close()
     
     print(f"\n   📊 {excel_file}")
 
@@ -820,6 +1051,11 @@ if __name__ == "__main__":
         print("\n❌ Operación cancelada")
         exit(0)
     
+    # Cargar índice de identidades de color de Scryfall (una sola vez)
+    if CHECK_COLOR_IDENTITY:
+        print(f"\n🎨 Cargando identidades de color de Scryfall...")
+        load_scryfall_oracle()
+    
     # Analizar cada mazo
     results = []
     
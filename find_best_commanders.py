@@ -1,13 +1,30 @@
+import datetime
+import functools
+import gzip
+import hashlib
+import json
+import os
+import unicodedata
+import numpy as np
 import pandas as pd
 import requests
 import re
+import threading
 import time
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+import xlsxwriter
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+# orjson (opcional) parsea JSON varias veces más rápido que el módulo estándar
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 
 # =========================
 # CONFIG
@@ -18,6 +35,84 @@ MIN_MATCHES = 10
 MAX_WORKERS = 5  # Número de peticiones concurrentes
 REQUEST_TIMEOUT = 10
 MAX_RETRIES = 3
+CACHE_DIR = ".edhrec_cache"     # Caché en disco de respuestas de EDHREC (compartida con complete_deck.py)
+CACHE_TTL = 7 * 24 * 3600       # Segundos antes de volver a descargar (7 días)
+MAX_SHEET_HYPERLINKS = 65530    # Límite de Excel de hipervínculos por hoja
+
+
+# =========================
+# PATRONES PRECOMPILADOS
+# =========================
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+_SLUG_DROP = str.maketrans("", "", "',:.")  # Caracteres que se eliminan del slug
+
+# Caracteres especiales a remover/reemplazar en nombres de comandante
+_SANITIZE_TRANS = str.maketrans({",": "", "'": "", ":": "", "/": "_", "-": "_"})
+
+
+# =========================
+# ESTILOS EXCEL (definidos una sola vez; cada libro crea sus formatos al abrirse)
+# =========================
+EXCEL_STYLES = {
+    "header": {"bold": True, "border": 1, "align": "center", "valign": "top"},
+    "hyper": {"font_color": "#0563C1", "underline": 1},
+    "yellow": {"bg_color": "#FFF2CC"},
+    "green": {"bg_color": "#CCFFCC"},
+    "blue": {"bg_color": "#CCE5FF"},
+    "red": {"bg_color": "#FFCCCC"},
+    "light_green": {"bg_color": "#90EE90"},
+    "gold": {"bg_color": "#FFD700"},
+    "gray": {"bg_color": "#F0F0F0"},
+    "orange": {"bg_color": "#FFE6CC"},
+}
+
+# Color de cada prioridad en la decklist consolidada
+PRIORITY_STYLES = {
+    "⭐ Alta": "gold",
+    "🔥 Media-Alta": "green",
+    "📘 Media": "blue",
+    "📗 Baja": "gray",
+}
+
+
+def new_workbook(path):
+    """
+    Abre un libro xlsxwriter en modo streaming (cada fila se vuelca a disco
+    al pasar a la siguiente) y crea sus formatos a partir de EXCEL_STYLES
+    """
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    formats = {name: workbook.add_format(style) for name, style in EXCEL_STYLES.items()}
+    return workbook, formats
+
+
+def excel_rows(df):
+    """Filas de df como tuplas de escalares de Python (None en lugar de NaN/inf)"""
+    df = df.replace([np.inf, -np.inf], np.nan)
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def write_sheet(workbook, formats, sheet_name, df):
+    """Escribe un DataFrame sin formato especial: encabezado y filas en orden"""
+    ws = workbook.add_worksheet(sheet_name)
+    ws.write_row(0, 0, df.columns, formats["header"])
+    for r, row in enumerate(excel_rows(df), 1):
+        ws.write_row(r, 0, row)
+    return ws
+
+
+def write_card_cell(ws, row, col, card_name, url, hyper_fmt, links_added):
+    """
+    Escribe el nombre de la carta con hipervínculo a url (si hay url y la hoja
+    no llegó al límite de Excel); si xlsxwriter rechaza el link (URL demasiado
+    larga o límite alcanzado) se escribe el nombre como texto
+    Retorna el número de hipervínculos escritos en la hoja
+    """
+    if url and links_added < MAX_SHEET_HYPERLINKS:
+        if ws.write_url(row, col, url, hyper_fmt, string=card_name) == 0:
+            return links_added + 1
+    
+    ws.write_string(row, col, card_name)
+    return links_added
 
 
 # =========================
@@ -32,7 +127,13 @@ def create_session():
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET"]
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    # Conexiones keep-alive reutilizadas por todos los hilos (sin repetir el handshake TLS)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy,
+        pool_connections=MAX_WORKERS,
+        pool_maxsize=MAX_WORKERS * 2,
+        pool_block=True
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
@@ -41,6 +142,28 @@ def create_session():
 # Sesión global reutilizable
 SESSION = create_session()
 
+# Limitador compartido por todos los hilos: como mucho una petición cada RATE_LIMIT s
+_RATE_LOCK = threading.Lock()
+_next_request_at = 0.0
+
+
+def rate_limited_get(url):
+    """
+    GET con la sesión global, espaciando las peticiones de todos los hilos
+    Solo se espera justo antes de la petición (no después de procesar la carta)
+    """
+    global _next_request_at
+    
+    with _RATE_LOCK:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + RATE_LIMIT
+    
+    if wait > 0:
+        time.sleep(wait)
+    
+    return SESSION.get(url, timeout=REQUEST_TIMEOUT)
+
 
 # =========================
 # 1. LOAD INVENTORY + DEDUPE
@@ -52,17 +175,25 @@ inv_unique = inv.groupby("name_lower", as_index=False).agg(
     {"quantity":"sum", "name":"first"}
 )
 
-inv_map = {
-    row["name_lower"]: row["quantity"]
-    for _, row in inv_unique.iterrows()
-}
+inv_map = dict(zip(inv_unique["name_lower"].to_numpy(), inv_unique["quantity"].to_numpy()))
 
 # colecciones donde aparece cada carta
-inv_source_map = (
+inv_source_series = (
     inv.groupby("name_lower")["source"]
-    .agg(lambda xs: "; ".join(sorted(set(map(str, xs)))))
-    .to_dict()
+    .agg(lambda xs: "; ".join(sorted(set(xs.astype(str)))))
 )
+inv_source_map = inv_source_series.to_dict()
+
+
+def lookup_collections(names, default=np.nan):
+    """
+    Colecciones de cada nombre de una Series (default si no está en el inventario)
+    Cada nombre distinto se pasa a minúsculas y se busca una sola vez
+    """
+    codes, uniques = pd.factorize(names)
+    lowered = pd.Index(uniques).str.lower()
+    return inv_source_series.reindex(lowered, fill_value=default).to_numpy()[codes]
+
 
 BASIC_LANDS = {"plains","island","swamp","mountain","forest","wastes"}
 
@@ -70,44 +201,80 @@ BASIC_LANDS = {"plains","island","swamp","mountain","forest","wastes"}
 # =========================
 # 2. SLUG
 # =========================
+@functools.lru_cache(maxsize=8192)
 def slug(s: str) -> str:
     """
     Convierte nombres de cartas a formato slug para URLs de EDHREC
     Maneja tildes, acentos y caracteres especiales
     """
-    import unicodedata
-    
     # Normalizar unicode y remover acentos/tildes
     s = unicodedata.normalize('NFD', s)
     s = ''.join(char for char in s if unicodedata.category(char) != 'Mn')
     
-    s = s.lower()
-    # Remover caracteres especiales comunes
-    s = s.replace("'","").replace("'","").replace("â€™","")
-    s = s.replace(",","").replace(":","").replace(".","")
+    # Remover caracteres especiales comunes (una sola pasada con translate)
+    s = s.lower().translate(_SLUG_DROP)
     # Convertir espacios y otros caracteres no alfanuméricos a guiones
-    s = re.sub(r"[^a-z0-9]+","-",s)
+    s = _SLUG_RE.sub("-", s)
     return s.strip("-")
 
 
+# Slug de cada carta del inventario calculado una sola vez (se usa en cada petición)
+inv_unique["slug"] = inv_unique["name"].map(slug)
+
+
 # =========================
 # 3. FETCH CARD JSON (CON MANEJO DE ERRORES)
 # =========================
-def fetch_card_json(card_name):
-    url = f"https://json.edhrec.com/pages/cards/{slug(card_name)}.json"
+def fetch_json(url):
+    """
+    GET con caché en disco (JSON comprimido con gzip) indexado por URL
+    Retorna (status_code, json); json es None si la respuesta no es 200
+    """
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    path = Path(CACHE_DIR) / digest[:2] / f"{digest}.json.gz"
+    
+    if path.exists() and time.time() - path.stat().st_mtime < CACHE_TTL:
+        return 200, json_loads(gzip.decompress(path.read_bytes()))
+    
+    r = rate_limited_get(url)
+    if r.status_code != 200:
+        return r.status_code, None
+    
+    data = json_loads(r.content)
+    
+    # Escritura atómica (tmp propio de cada proceso e hilo) para no dejar archivos corruptos;
+    # si la caché no se puede escribir, la respuesta descargada se devuelve igualmente
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(gzip.compress(r.content))
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+    
+    return 200, data
+
+
+def fetch_card_json(card_name, card_slug=None):
+    if card_slug is None:
+        card_slug = slug(card_name)
+    url = f"https://json.edhrec.com/pages/cards/{card_slug}.json"
     try:
-        r = SESSION.get(url, timeout=REQUEST_TIMEOUT)
-        if r.status_code == 403:
+        status, data = fetch_json(url)
+        if status == 403:
             # 403 generalmente significa que la carta no existe en EDHREC
             # (común con cartas nuevas o de sets especiales)
             return None
-        if r.status_code == 404:
+        if status == 404:
             # Carta no encontrada en EDHREC
             return None
-        if r.status_code != 200:
-            print(f"  ⚠️  Error {r.status_code} para {card_name}")
+        if status != 200:
+            print(f"  ⚠️  Error {status} para {card_name}")
             return None
-        return r.json()
+        return data
     except requests.exceptions.ConnectionError:
         print(f"  ❌ Error de conexión para {card_name} - verifica tu internet")
         return None
@@ -119,6 +286,27 @@ def fetch_card_json(card_name):
         return None
 
 
+# =========================
+# 3B. RECORRER JSON
+# =========================
+def walk_json(data):
+    """
+    Recorre un JSON anidado y produce cada dict encontrado
+    DFS iterativo (sin recursión) en el mismo orden que un recorrido recursivo
+    """
+    stack = [data]
+    pop = stack.pop
+    extend = stack.extend
+    
+    while stack:
+        o = pop()
+        if isinstance(o, dict):
+            yield o
+            extend(reversed(o.values()))
+        elif isinstance(o, list):
+            extend(reversed(o))
+
+
 # =========================
 # 4. FIND SCRYFALL FOR THIS CARD
 # =========================
@@ -127,55 +315,71 @@ def find_scryfall_for_card(data, target_name):
         return None
     target = target_name.lower()
     found = None
+    stack = [data]
 
-    def scan(o):
-        nonlocal found
-        if found:
-            return
+    while stack:
+        o = stack.pop()
         if isinstance(o, dict):
-            if o.get("name") and o["name"].lower() == target:
+            name = o.get("name")
+            if name and name.lower() == target:
                 if "scryfall_uri" in o:
                     found = o["scryfall_uri"]
-                    return
-            for v in o.values():
-                scan(v)
+                    if found:
+                        return found  # Primera coincidencia: cortar el recorrido
+                    continue
+            stack.extend(reversed(o.values()))
         elif isinstance(o, list):
-            for e in o:
-                scan(e)
+            stack.extend(reversed(o))
 
-    scan(data)
     return found
 
 
+# =========================
+# 4B. INDEXAR SCRYFALL DEL JSON
+# =========================
+def index_scryfall(data):
+    """
+    Recorre el JSON una sola vez y retorna {nombre_lower: scryfall_uri}
+    (se conserva el primer link no vacío de cada carta, como find_scryfall_for_card)
+    """
+    index = {}
+    if data is None:
+        return index
+    
+    for o in walk_json(data):
+        name = o.get("name")
+        if name and "scryfall_uri" in o:
+            name_lower = name.lower()
+            if not index.get(name_lower):
+                index[name_lower] = o["scryfall_uri"]
+    
+    return index
+
+
 # =========================
 # 5. EXTRACT COMMANDERS (TOP COMMANDER ANALYSIS)
 # =========================
-def extract_commanders_from_card_json(data, card_name):
+def extract_commanders_from_card_json(data, card_name, scry_map=None):
     commanders = []
-    scry = find_scryfall_for_card(data, card_name)
+    if scry_map is None:
+        scry_map = index_scryfall(data)
+    scry = scry_map.get(card_name.lower())
+
+    for o in walk_json(data):
+        url = o.get("url")
+        if isinstance(url,str) and "/commanders/" in url:
+            name = o.get("name")
+            inc  = o.get("inclusion")
+            pot  = o.get("potential_decks")
+            if name and inc and pot:
+                percent = inc/pot
+                if percent > 0.2:
+                    commanders.append({
+                        "commander": name,
+                        "percent": percent,
+                        "scryfall": scry
+                    })
 
-    def scan(o):
-        if isinstance(o, dict):
-            url = o.get("url")
-            if isinstance(url,str) and "/commanders/" in url:
-                name = o.get("name")
-                inc  = o.get("inclusion")
-                pot  = o.get("potential_decks")
-                if name and inc and pot:
-                    percent = inc/pot
-                    if percent > 0.2:
-                        commanders.append({
-                            "commander": name,
-                            "percent": percent,
-                            "scryfall": scry
-                        })
-            for v in o.values():
-                scan(v)
-        elif isinstance(o, list):
-            for e in o:
-                scan(e)
-
-    scan(data)
     return commanders
 
 
@@ -188,30 +392,21 @@ def extract_synergy_cards(data, card_name):
     Esto captura sinergias que el análisis de comandantes podría perder
     """
     synergy_cards = []
-    scry = find_scryfall_for_card(data, card_name)
     
-    def scan(o):
-        if isinstance(o, dict):
-            # Buscar secciones de synergy
-            if "synergy" in str(o.get("header", "")).lower() or "cards" in str(o.get("tag", "")).lower():
-                if "cardviews" in o:
-                    for cv in o["cardviews"]:
-                        nm = cv.get("name")
-                        syn = cv.get("synergy", 0)
-                        if nm and syn > 0.1:  # Solo sinergias significativas
-                            synergy_cards.append({
-                                "card": nm,
-                                "synergy": syn,
-                                "with_card": card_name
-                            })
-            
-            for v in o.values():
-                scan(v)
-        elif isinstance(o, list):
-            for e in o:
-                scan(e)
+    for o in walk_json(data):
+        # Buscar secciones de synergy
+        if "synergy" in str(o.get("header", "")).lower() or "cards" in str(o.get("tag", "")).lower():
+            if "cardviews" in o:
+                for cv in o["cardviews"]:
+                    nm = cv.get("name")
+                    syn = cv.get("synergy", 0)
+                    if nm and syn > 0.1:  # Solo sinergias significativas
+                        synergy_cards.append({
+                            "card": nm,
+                            "synergy": syn,
+                            "with_card": card_name
+                        })
     
-    scan(data)
     return synergy_cards
 
 
@@ -221,10 +416,9 @@ def extract_synergy_cards(data, card_name):
 def fetch_average_deck(commander_name):
     url = f"https://json.edhrec.com/pages/average-decks/{slug(commander_name)}.json"
     try:
-        r = SESSION.get(url, timeout=REQUEST_TIMEOUT)
-        if r.status_code != 200:
+        status, data = fetch_json(url)
+        if status != 200:
             return []
-        data = r.json()
     except requests.exceptions.ConnectionError:
         print(f"  ❌ Error de conexión al buscar average deck de {commander_name}")
         return []
@@ -237,43 +431,34 @@ def fetch_average_deck(commander_name):
 
     cards = set()
 
-    def scan(o):
-        if isinstance(o, dict):
-            if "cardviews" in o:
-                for cv in o["cardviews"]:
-                    nm = cv.get("name")
-                    if nm:
-                        cards.add(nm)
-            for v in o.values():
-                scan(v)
-        elif isinstance(o, list):
-            for e in o:
-                scan(e)
+    for o in walk_json(data):
+        if "cardviews" in o:
+            for cv in o["cardviews"]:
+                nm = cv.get("name")
+                if nm:
+                    cards.add(nm)
 
-    scan(data)
     return sorted(cards)
 
 
 # =========================
 # 8. PROCESS SINGLE CARD
 # =========================
-def process_card(idx, total, card, card_lower):
+def process_card(idx, total, card, card_lower, card_slug):
     """Procesa una carta individual (para paralelización)"""
     if card_lower in BASIC_LANDS:
         return None
     
     print(f"[{idx+1}/{total}] {card}...")
     
-    data = fetch_card_json(card)
+    data = fetch_card_json(card, card_slug)
     if data is None:
-        time.sleep(RATE_LIMIT)
         return None
     
-    coms = extract_commanders_from_card_json(data, card)
+    scry_map = index_scryfall(data)
+    coms = extract_commanders_from_card_json(data, card, scry_map)
     synergies = extract_synergy_cards(data, card)
     
-    time.sleep(RATE_LIMIT)
-    
     return {
         "card": card,
         "commanders": coms,
@@ -285,62 +470,64 @@ def process_card(idx, total, card, card_lower):
 # 9. MAIN ANALYSIS (MEJORADO)
 # =========================
 def analyze_inventory():
-    commander_stats = {}
+    # Estadísticas por comandante (la entrada se crea solo la primera vez)
+    commander_stats = defaultdict(lambda: {
+        "matches":0,
+        "percent_sum":0.0,
+        "percent_count":0,
+        "cards":[]
+    })
     synergy_recommendations = []
     skipped_cards = []  # Para trackear cartas que no se pudieron procesar
     total = len(inv_unique)
     
     print(f"\n🔍 Analizando {total} cartas únicas...")
     
-    # Procesar cartas con manejo de errores robusto
-    for idx, row in inv_unique.iterrows():
-        card = row["name"]
-        card_lower = row["name_lower"]
-        
-        result = process_card(idx, total, card, card_lower)
-        
-        if result is None:
-            skipped_cards.append(card)
-            continue
-        
-        # Procesar comandantes
-        for c in result["commanders"]:
-            cname = c["commander"]
-            percent = c["percent"]
-            scry = c["scryfall"]
-
-            entry = commander_stats.setdefault(
-                cname,
-                {
-                    "matches":0,
-                    "percent_sum":0.0,
-                    "percent_count":0,
-                    "cards":[]
-                }
-            )
-
-            entry["cards"].append({
-                "name": card,
-                "percent": percent,
-                "source": "edhrec",
-                "scryfall": scry
-            })
-
-            entry["matches"] += 1
-            entry["percent_sum"] += percent
-            entry["percent_count"] += 1
+    # Columnas como arrays de NumPy (sin construir una Series por fila)
+    names = inv_unique["name"].to_numpy()
+    lowers = inv_unique["name_lower"].to_numpy()
+    slugs = inv_unique["slug"].to_numpy()
+    tasks = list(zip(range(total), names, lowers, slugs))
+    
+    # Procesar cartas en paralelo (I/O) y combinar en orden en el hilo principal
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = executor.map(lambda task: process_card(task[0], total, *task[1:]), tasks)
         
-        # Procesar sinergias
-        for syn in result["synergies"]:
-            syn_card_lower = syn["card"].lower()
-            if syn_card_lower in inv_map:
-                synergy_recommendations.append({
-                    "card_owned": card,
-                    "synergy_card": syn["card"],
-                    "synergy_score": syn["synergy"],
-                    "both_owned": True
+        for (idx, card, card_lower, card_slug), result in zip(tasks, results):
+            if result is None:
+                skipped_cards.append(card)
+                continue
+            
+            # Procesar comandantes
+            for c in result["commanders"]:
+                cname = c["commander"]
+                percent = c["percent"]
+                scry = c["scryfall"]
+
+                entry = commander_stats[cname]
+
+                entry["cards"].append({
+                    "name": card,
+                    "percent": percent,
+                    "source": "edhrec",
+                    "scryfall": scry
                 })
 
+                entry["matches"] += 1
+                entry["percent_sum"] += percent
+                entry["percent_count"] += 1
+            
+            # Procesar sinergias
+            for syn in result["synergies"]:
+                syn_card_lower = syn["card"].lower()
+                if syn_card_lower in inv_map:
+                    synergy_recommendations.append({
+                        "card_owned": card,
+                        "synergy_card": syn["card"],
+                        "synergy_score": syn["synergy"],
+                        "both_owned": True
+                    })
+
     rows=[]
     for cname,info in commander_stats.items():
         if info["matches"] < MIN_MATCHES:
@@ -376,37 +563,44 @@ def analyze_inventory():
 # =========================
 # 10. ANÁLISIS POR TEMAS
 # =========================
+THEME_KEYWORDS = {
+    "Tokens": ["token", "create", "populate", "doubling season", "anointed procession"],
+    "Sacrifice": ["sacrifice", "aristocrats", "blood artist", "zulaport", "mayhem devil"],
+    "+1/+1 Counters": ["counter", "+1/+1", "proliferate", "modular", "evolve"],
+    "Graveyard": ["graveyard", "reanimate", "flashback", "delve", "escape", "dredge"],
+    "Artifacts": ["artifact", "affinity", "metalcraft", "improvise", "treasure"],
+    "Enchantments": ["enchantment", "constellation", "enchantress", "saga"],
+    "Spellslinger": ["instant", "sorcery", "prowess", "storm", "magecraft"],
+    "Voltron": ["equipment", "aura", "voltron", "commander damage"],
+    "Ramp": ["ramp", "land", "mana", "cultivate", "kodama", "explosive vegetation"],
+    "Card Draw": ["draw", "card advantage", "rhystic", "curiosity", "wheel"],
+    "Tribal": ["elf", "goblin", "zombie", "dragon", "changeling", "tribal"],
+    "Control": ["counter", "removal", "board wipe", "control", "cyclonic rift"],
+    "Combo": ["infinite", "combo", "win condition", "thoracle"],
+    "Landfall": ["landfall", "land enters", "fetch", "evolving wilds"],
+    "Blink": ["blink", "flicker", "enters the battlefield", "etb"],
+}
+
+# Una alternación precompilada por tema (búsqueda de subcadena, igual que `kw in nombre`)
+_THEME_RES = {
+    theme: re.compile("|".join(re.escape(kw) for kw in keywords))
+    for theme, keywords in THEME_KEYWORDS.items()
+}
+
+
 def analyze_themes(flat_cards, synergies):
     """
     Detecta temas/arquetipos basándose en las cartas y comandantes
     """
-    theme_keywords = {
-        "Tokens": ["token", "create", "populate", "doubling season", "anointed procession"],
-        "Sacrifice": ["sacrifice", "aristocrats", "blood artist", "zulaport", "mayhem devil"],
-        "+1/+1 Counters": ["counter", "+1/+1", "proliferate", "modular", "evolve"],
-        "Graveyard": ["graveyard", "reanimate", "flashback", "delve", "escape", "dredge"],
-        "Artifacts": ["artifact", "affinity", "metalcraft", "improvise", "treasure"],
-        "Enchantments": ["enchantment", "constellation", "enchantress", "saga"],
-        "Spellslinger": ["instant", "sorcery", "prowess", "storm", "magecraft"],
-        "Voltron": ["equipment", "aura", "voltron", "commander damage"],
-        "Ramp": ["ramp", "land", "mana", "cultivate", "kodama", "explosive vegetation"],
-        "Card Draw": ["draw", "card advantage", "rhystic", "curiosity", "wheel"],
-        "Tribal": ["elf", "goblin", "zombie", "dragon", "changeling", "tribal"],
-        "Control": ["counter", "removal", "board wipe", "control", "cyclonic rift"],
-        "Combo": ["infinite", "combo", "win condition", "thoracle"],
-        "Landfall": ["landfall", "land enters", "fetch", "evolving wilds"],
-        "Blink": ["blink", "flicker", "enters the battlefield", "etb"],
-    }
-    
-    theme_scores = {theme: 0 for theme in theme_keywords}
-    theme_cards = {theme: [] for theme in theme_keywords}
+    theme_scores = {theme: 0 for theme in THEME_KEYWORDS}
+    theme_cards = {theme: [] for theme in THEME_KEYWORDS}
     
-    # Analizar cartas
+    # Analizar cartas (una búsqueda de regex por tema en vez de una por keyword)
     for card_entry in flat_cards:
         card_name = card_entry["card"].lower()
         
-        for theme, keywords in theme_keywords.items():
-            if any(kw in card_name for kw in keywords):
+        for theme, pattern in _THEME_RES.items():
+            if pattern.search(card_name):
                 theme_scores[theme] += 1
                 if len(theme_cards[theme]) < 10:  # Limitar a 10 ejemplos
                     theme_cards[theme].append(card_entry["card"])
@@ -459,10 +653,11 @@ def create_executive_summary(commanders_df, cards_df, synergies):
             "Descripción": f"{top_commander['matches']} cartas coincidentes, {top_commander['avg_percent']:.1%} promedio inclusión"
         })
     
-    # Conteo por fuente
-    both_count = len(cards_df[cards_df["source"] == "both"])
-    edhrec_count = len(cards_df[cards_df["source"] == "edhrec"])
-    average_count = len(cards_df[cards_df["source"] == "average"])
+    # Conteo por fuente (una sola pasada en vez de un filtro por fuente)
+    source_counts = cards_df["source"].value_counts()
+    both_count = int(source_counts.get("both", 0))
+    edhrec_count = int(source_counts.get("edhrec", 0))
+    average_count = int(source_counts.get("average", 0))
     
     summary_data.append({
         "Métrica": "Cartas con Doble Validación (BOTH)",
@@ -511,174 +706,188 @@ def create_executive_summary(commanders_df, cards_df, synergies):
 # =========================
 def export_with_formatting(df, synergies):
     flat = []
+    # Índice (comandante, carta_lower) -> fila de flat, para búsquedas O(1)
+    flat_index = {}
 
     print("\n📊 Generando reporte detallado...")
     
     # ---- 1. EDHREC CARDS ----
-    for _, row in df.iterrows():
-        commander = row["commander"]
-        for c in row["cards"]:
+    for commander, cards in zip(df["commander"].to_numpy(), df["cards"].to_numpy()):
+        for c in cards:
             card = c["name"]
             lower = card.lower()
 
-            flat.append({
+            entry = {
                 "commander": commander,
                 "card": card,
                 "percent": c["percent"],
                 "scryfall": c["scryfall"],
-                "source": "edhrec",
-                "collections": inv_source_map.get(lower, "")
-            })
+                "source": "edhrec"
+            }
+            flat.append(entry)
+            flat_index.setdefault((commander, lower), entry)
 
     # ---- 2. AVERAGE DECK CARDS ----
-    total_commanders = len(df)
-    for idx, row in df.iterrows():
-        commander = row["commander"]
+    # Las descargas van en paralelo (mismo pool y limitador que analyze_inventory);
+    # la fusión en flat se hace después, en serie y en el orden original
+    commanders = df["commander"].tolist()
+    total_commanders = len(commanders)
+    
+    def fetch_owned_average(task):
+        idx, commander = task
         print(f"  [{idx+1}/{total_commanders}] Consultando average deck de {commander}...")
+        # Solo cartas del inventario (se descartan antes de la fusión)
+        owned_cards = [(card, card.lower()) for card in fetch_average_deck(commander)]
+        return [(card, lower) for card, lower in owned_cards if lower in inv_map]
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        average_decks = list(executor.map(fetch_owned_average, zip(df.index, commanders)))
         
-        avg_cards = fetch_average_deck(commander)
-
-        for card in avg_cards:
-            lower = card.lower()
-            if lower not in inv_map:
-                continue
-
-            data = fetch_card_json(card)
-            scry = find_scryfall_for_card(data, card)
-
-            collections = inv_source_map.get(lower, "")
+        # Link de Scryfall por carta (lower), compartido entre comandantes:
+        # cada carta nueva se descarga una sola vez en toda la pasada
+        pending = {}
+        for commander, owned_cards in zip(commanders, average_decks):
+            for card, lower in owned_cards:
+                if (commander, lower) not in flat_index:
+                    pending.setdefault(lower, card)
+        
+        scry_cache = dict(zip(
+            pending,
+            executor.map(lambda card: find_scryfall_for_card(fetch_card_json(card), card), pending.values())
+        ))
 
+    for commander, owned_cards in zip(commanders, average_decks):
+        for card, lower in owned_cards:
             # check if already added
-            already = next((x for x in flat if x["commander"]==commander and x["card"].lower()==lower), None)
+            already = flat_index.get((commander, lower))
 
             if already:
                 already["source"] = "both"
-            else:
-                flat.append({
-                    "commander": commander,
-                    "card": card,
-                    "percent": None,
-                    "scryfall": scry,
-                    "source": "average",
-                    "collections": collections
-                })
-            
-            time.sleep(RATE_LIMIT)
+                continue
+
+            entry = {
+                "commander": commander,
+                "card": card,
+                "percent": None,
+                "scryfall": scry_cache[lower],
+                "source": "average"
+            }
+            flat.append(entry)
+            flat_index[(commander, lower)] = entry
 
     df2 = pd.DataFrame(flat)
+    
+    # Colecciones de todas las filas (ambos pasos) en una sola búsqueda vectorizada
+    df2["collections"] = lookup_collections(df2["card"], default="")
 
     # ---- ORDENAMIENTO POR CANTIDAD DE CARTAS + PRIORIDAD ----
-    def get_sort_priority(row):
-        source = row["source"]
-        percent = row["percent"] if pd.notna(row["percent"]) else 0
-        
-        if source == "both":
-            return (1, -percent)  # Amarillo primero, ordenado por percent desc
-        elif source == "edhrec" and percent > 0.20:
-            return (2, -percent)  # Verde segundo
-        elif source == "average":
-            return (3, 0)  # Azul tercero
-        else:  # edhrec con percent < 0.20
-            return (4, -percent)  # Rojo último
+    # Prioridad vectorizada (columnas numéricas en vez de una tupla por fila):
+    #   1 = both (amarillo), 2 = edhrec >20% (verde), 3 = average (azul), 4 = resto (rojo)
+    #   dentro de cada grupo, percent descendente (average sin orden interno)
+    source = df2["source"].to_numpy()
+    percent = df2["percent"].fillna(0).to_numpy(dtype=float)
+    is_average = source == "average"
+    
+    df2["_bucket"] = np.select(
+        [source == "both", (source == "edhrec") & (percent > 0.20), is_average],
+        [1, 2, 3],
+        default=4
+    )
+    df2["_neg_pct"] = np.where(is_average, 0.0, -percent)
     
     # Calcular total de cartas por comandante para ordenar
-    commander_card_count = df2.groupby("commander").size().to_dict()
+    commander_card_count = df2.groupby("commander", sort=False).size().to_dict()
     df2["commander_total"] = df2["commander"].map(commander_card_count)
     
-    df2["sort_key"] = df2.apply(lambda row: get_sort_priority(row), axis=1)
     df2 = df2.sort_values(
-        by=["commander_total", "commander", "sort_key"],
-        ascending=[False, True, True]
+        by=["commander_total", "commander", "_bucket", "_neg_pct"],
+        ascending=[False, True, True, True]
     )
-    df2 = df2.drop(columns=["sort_key", "commander_total"])
+    df2 = df2.drop(columns=["_bucket", "_neg_pct", "commander_total"])
 
     out = "commander_matches_formatted.xlsx"
     
     # ---- MANEJO DE ARCHIVO BLOQUEADO ----
     # Si el archivo está abierto en Excel, intentar con nombre alternativo
-    try:
-        # Intentar eliminar archivo antiguo si existe
-        import os
-        if os.path.exists(out):
-            try:
-                os.remove(out)
-            except PermissionError:
-                # Archivo abierto, usar nombre alternativo
-                import datetime
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                out = f"commander_matches_{timestamp}.xlsx"
-                print(f"\n⚠️  El archivo original está abierto. Guardando como: {out}")
-    except Exception as e:
-        print(f"⚠️  Advertencia al verificar archivo: {e}")
+    # (basta con abrirlo para escritura: el libro nuevo lo sobrescribe igualmente)
+    if os.path.exists(out):
+        try:
+            with open(out, "r+b"):
+                pass
+        except PermissionError:
+            # Archivo abierto, usar nombre alternativo
+            out = f"commander_matches_{datetime.datetime.now():%Y%m%d_%H%M%S}.xlsx"
+            print(f"\n⚠️  El archivo original está abierto. Guardando como: {out}")
     
     # ---- CREAR ARCHIVO EXCEL CON MÚLTIPLES HOJAS ----
-    with pd.ExcelWriter(out, engine='openpyxl') as writer:
-        df2.to_excel(writer, sheet_name='Comandantes Recomendados', index=False)
-        
-        # ---- SEGUNDA HOJA: ANÁLISIS DE SINERGIAS ----
-        if synergies:
-            synergy_df = pd.DataFrame(synergies)
-            
-            # Agregar información de colecciones
-            synergy_df["card_owned_collections"] = synergy_df["card_owned"].str.lower().map(inv_source_map)
-            synergy_df["synergy_card_collections"] = synergy_df["synergy_card"].str.lower().map(inv_source_map)
-            
-            # Ordenar por synergy score descendente
-            synergy_df = synergy_df.sort_values(by="synergy_score", ascending=False)
-            
-            synergy_df.to_excel(writer, sheet_name='Sinergias Detectadas', index=False)
-        
-        # ---- TERCERA HOJA: ANÁLISIS POR TEMAS ----
-        theme_analysis = analyze_themes(flat, synergies)
-        if not theme_analysis.empty:
-            theme_analysis.to_excel(writer, sheet_name='Análisis por Temas', index=False)
-        
-        # ---- CUARTA HOJA: RESUMEN EJECUTIVO ----
-        summary = create_executive_summary(df, df2, synergies)
-        summary.to_excel(writer, sheet_name='Resumen Ejecutivo', index=False)
-
+    # Escritura en streaming: cada celda se escribe una sola vez, con su formato
+    # decidido desde el dato (sin recorrer la hoja después)
+    workbook, fmt = new_workbook(out)
+    
+    ws = workbook.add_worksheet('Comandantes Recomendados')
+    ws.write_row(0, 0, df2.columns, fmt["header"])
+    
     # ---- FORMATO CON COLORES EN PRIMERA HOJA ----
-    wb = load_workbook(out)
-    ws = wb['Comandantes Recomendados']
-
-    green = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-    red   = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-    blue  = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-    yellow= PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-
-    for r in range(2, ws.max_row+1):
-        percent = ws[f"C{r}"].value
-        source  = ws[f"E{r}"].value
+    links_added = 0
+    for r, (commander, card, percent, url, source, collections) in enumerate(excel_rows(df2), 1):
+        ws.write(r, 0, commander)
+        links_added = write_card_cell(ws, r, 1, card, url, fmt["hyper"], links_added)
 
         if source == "both":
-            ws[f"C{r}"].fill = yellow
+            percent_fmt = fmt["yellow"]
         elif source == "average":
-            ws[f"C{r}"].fill = blue
-        elif isinstance(percent,(int,float)) and percent > 0.5:
-            ws[f"C{r}"].fill = green
-        elif isinstance(percent,(int,float)) and percent > 0.20:
-            ws[f"C{r}"].fill = red
-
-        url = ws[f"D{r}"].value
-        if url:
-            ws[f"B{r}"].hyperlink = url
-            ws[f"B{r}"].style = "Hyperlink"
-    
-    # ---- FORMATO EN HOJA DE SINERGIAS ----
-    if 'Sinergias Detectadas' in wb.sheetnames:
-        ws_syn = wb['Sinergias Detectadas']
-        high_syn = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-        med_syn = PatternFill(start_color="FFD700", end_color="FFD700", fill_type="solid")
+            percent_fmt = fmt["blue"]
+        elif isinstance(percent, (int, float)) and percent > 0.5:
+            percent_fmt = fmt["green"]
+        elif isinstance(percent, (int, float)) and percent > 0.20:
+            percent_fmt = fmt["red"]
+        else:
+            percent_fmt = None
+        ws.write(r, 2, percent, percent_fmt)
+        
+        ws.write_row(r, 3, (url, source, collections))
+    
+    # ---- SEGUNDA HOJA: ANÁLISIS DE SINERGIAS ----
+    if synergies:
+        synergy_df = pd.DataFrame(synergies)
+        
+        # Agregar información de colecciones
+        synergy_df["card_owned_collections"] = lookup_collections(synergy_df["card_owned"])
+        synergy_df["synergy_card_collections"] = lookup_collections(synergy_df["synergy_card"])
+        
+        # Ordenar por synergy score descendente
+        synergy_df = synergy_df.sort_values(by="synergy_score", ascending=False)
+        
+        ws_syn = workbook.add_worksheet('Sinergias Detectadas')
+        ws_syn.write_row(0, 0, synergy_df.columns, fmt["header"])
         
-        for r in range(2, ws_syn.max_row+1):
-            synergy_val = ws_syn[f"C{r}"].value
+        # ---- FORMATO EN HOJA DE SINERGIAS ----
+        for r, row in enumerate(excel_rows(synergy_df), 1):
+            synergy_val = row[2]
+            synergy_fmt = None
             if isinstance(synergy_val, (int, float)):
                 if synergy_val > 0.3:
-                    ws_syn[f"C{r}"].fill = high_syn
+                    synergy_fmt = fmt["light_green"]
                 elif synergy_val > 0.15:
-                    ws_syn[f"C{r}"].fill = med_syn
+                    synergy_fmt = fmt["gold"]
+            
+            ws_syn.write_row(r, 0, row[:2])
+            ws_syn.write(r, 2, synergy_val, synergy_fmt)
+            ws_syn.write_row(r, 3, row[3:])
+    
+    # ---- TERCERA HOJA: ANÁLISIS POR TEMAS ----
+    # (sin cartas no hay temas: se evita el recorrido y el DataFrame vacío)
+    if flat:
+        theme_analysis = analyze_themes(flat, synergies)
+        if not theme_analysis.empty:
+            write_sheet(workbook, fmt, 'Análisis por Temas', theme_analysis)
+    
+    # ---- CUARTA HOJA: RESUMEN EJECUTIVO ----
+    summary = create_executive_summary(df, df2, synergies)
+    write_sheet(workbook, fmt, 'Resumen Ejecutivo', summary)
+    
+    workbook.close()
 
-    wb.save(out)
     print(f"\n✅ Archivo generado: {out}")
     print(f"\n📋 Contenido del archivo:")
     print(f"  📄 Hoja 1: Comandantes Recomendados (ordenados por cantidad de cartas)")
@@ -759,11 +968,11 @@ def generate_decklists_interactive(commanders_df, cards_df):
     print("\n📋 Comandantes disponibles:")
     print("-" * 60)
     
-    # Mostrar lista numerada de comandantes
+    # Mostrar lista numerada de comandantes (columnas leídas una sola vez)
     commander_list = commanders_df["commander"].tolist()
-    for idx, commander in enumerate(commander_list, 1):
-        matches = commanders_df[commanders_df["commander"] == commander]["matches"].iloc[0]
-        avg_pct = commanders_df[commanders_df["commander"] == commander]["avg_percent"].iloc[0]
+    matches_list = commanders_df["matches"].to_numpy()
+    avg_pct_list = commanders_df["avg_percent"].to_numpy()
+    for idx, (commander, matches, avg_pct) in enumerate(zip(commander_list, matches_list, avg_pct_list), 1):
         print(f"{idx:2d}. {commander:40s} ({matches} cartas, {avg_pct:.1%} avg)")
     
     print("-" * 60)
@@ -845,33 +1054,31 @@ def generate_decklists(selected_commanders, cards_df, commanders_df):
     
     print(f"\n📝 Generando decklist consolidada para {len(selected_commanders)} comandantes...")
     
-    # Recopilar TODAS las cartas de los comandantes seleccionados
-    all_cards = []
-    
-    for commander in selected_commanders:
-        commander_cards = cards_df[cards_df["commander"] == commander].copy()
-        
-        for _, card in commander_cards.iterrows():
-            all_cards.append({
-                "card_name": card["card"],
-                "commander": commander,
-                "collection": card["collections"] if pd.notna(card["collections"]) else "Sin colección",
-                "source": card["source"],
-                "percent": card["percent"] if pd.notna(card["percent"]) else 0,
-                "scryfall": card["scryfall"] if pd.notna(card["scryfall"]) else ""
-            })
+    # Recopilar TODAS las cartas de los comandantes seleccionados con un solo filtro
+    # (orden estable: comandantes en el orden de selección, cartas en su orden original)
+    commander_order = {commander: i for i, commander in enumerate(selected_commanders)}
+    sub = cards_df[cards_df["commander"].isin(commander_order)]
+    sub = sub.iloc[np.argsort(sub["commander"].map(commander_order).to_numpy(), kind="stable")]
     
     # Crear DataFrame consolidado
-    df_consolidated = pd.DataFrame(all_cards)
+    df_consolidated = pd.DataFrame({
+        "card_name": sub["card"].to_numpy(),
+        "commander": sub["commander"].to_numpy(),
+        "collection": sub["collections"].fillna("Sin colección").to_numpy(),
+        "source": sub["source"].to_numpy(),
+        "percent": sub["percent"].fillna(0).to_numpy(),
+        "scryfall": sub["scryfall"].fillna("").to_numpy()
+    })
     
     # Agrupar cartas duplicadas (misma carta para múltiples comandantes)
-    df_grouped = df_consolidated.groupby("card_name").agg({
-        "commander": lambda x: list(x),
-        "collection": "first",  # Asumimos que la colección es la misma
-        "source": "first",
-        "percent": "first",
-        "scryfall": "first"
-    }).reset_index()
+    # (la lista de comandantes es la única agregación en Python; el resto usa first())
+    grouped = df_consolidated.groupby("card_name")
+    df_grouped = (
+        grouped[["collection", "source", "percent", "scryfall"]].first()  # Asumimos que la colección es la misma
+        .assign(commander=grouped["commander"].agg(list))
+        [["commander", "collection", "source", "percent", "scryfall"]]
+        .reset_index()
+    )
     
     # Crear tags de comandantes
     df_grouped["commander_tags"] = df_grouped["commander"].apply(
@@ -900,7 +1107,7 @@ def generate_decklists(selected_commanders, cards_df, commanders_df):
     
     # Mostrar resumen por colección
     print(f"\n📦 Resumen por colección:")
-    collection_summary = df_grouped.groupby("collection").size().sort_values(ascending=False)
+    collection_summary = df_grouped["collection"].value_counts()  # Ya viene ordenado de mayor a menor
     for collection, count in collection_summary.items():
         print(f"   {collection:30s} {count:3d} cartas")
 
@@ -908,14 +1115,14 @@ def generate_decklists(selected_commanders, cards_df, commanders_df):
 # =========================
 # 16. SANITIZAR NOMBRE DE COMANDANTE
 # =========================
+@functools.lru_cache(maxsize=None)
 def sanitize_commander_name(commander):
     """
     Convierte nombre de comandante a formato tag limpio
     Ejemplo: "Atraxa, Praetors' Voice" -> "Atraxa_Praetors_Voice"
     """
     # Remover caracteres especiales
-    clean = commander.replace(",", "").replace("'", "").replace(":", "")
-    clean = clean.replace("/", "_").replace("-", "_")
+    clean = commander.translate(_SANITIZE_TRANS)
     # Reemplazar espacios con guiones bajos
     clean = "_".join(clean.split())
     return clean
@@ -990,106 +1197,103 @@ def generate_consolidated_excel(df_grouped, commanders, output_file):
     """
     Genera archivo Excel con vista consolidada de cartas
     """
-    # Preparar datos para Excel
-    excel_data = []
-    
-    for _, card in df_grouped.iterrows():
-        num_decks = len(card["commander"])
-        commander_list = ", ".join(card["commander"])
-        
-        excel_data.append({
-            "Carta": card["card_name"],
-            "Colección": card["collection"],
-            "Comandantes": commander_list,
-            "# Decks": num_decks,
-            "Fuente": card["source"],
-            "Inclusión %": card["percent"] if card["percent"] > 0 else None,
-            "Prioridad": "⭐ Alta" if card["source"] == "both" else 
-                        ("🔥 Media-Alta" if (card["source"] == "edhrec" and card["percent"] > 0.20) else
-                         ("📘 Media" if card["source"] == "average" else "📗 Baja")),
-            "Scryfall": card["scryfall"],
-            "Tags": card["commander_tags"]
-        })
-    
-    df_excel = pd.DataFrame(excel_data)
+    # Preparar datos para Excel (columnas completas, mismo índice que df_grouped)
+    source = df_grouped["source"].to_numpy()
+    percent = df_grouped["percent"].to_numpy(dtype=float)
+    
+    # Prioridad vectorizada: 1 = both, 2 = edhrec >20%, 3 = average, 4 = resto
+    priority_rank = np.select(
+        [source == "both", (source == "edhrec") & (percent > 0.20), source == "average"],
+        [1, 2, 3],
+        default=4
+    )
+    priority_labels = np.array(["⭐ Alta", "🔥 Media-Alta", "📘 Media", "📗 Baja"])
+    
+    df_excel = pd.DataFrame({
+        "Carta": df_grouped["card_name"],
+        "Colección": df_grouped["collection"],
+        "Comandantes": df_grouped["commander"].map(", ".join),
+        "# Decks": df_grouped["commander"].str.len(),
+        "Fuente": df_grouped["source"],
+        "Inclusión %": df_grouped["percent"].where(percent > 0),
+        "Prioridad": priority_labels[priority_rank - 1],
+        "Scryfall": df_grouped["scryfall"],
+        "Tags": df_grouped["commander_tags"]
+    })
     
-    # Ordenar por colección y prioridad
-    priority_map = {"⭐ Alta": 1, "🔥 Media-Alta": 2, "📘 Media": 3, "📗 Baja": 4}
-    df_excel["_sort"] = df_excel["Prioridad"].map(priority_map)
+    # Ordenar por colección y prioridad (clave entera, sin comparar los textos con emoji)
+    df_excel["_sort"] = priority_rank
     df_excel = df_excel.sort_values(
         by=["Colección", "_sort", "# Decks", "Inclusión %"],
         ascending=[True, True, False, False]
     )
     df_excel = df_excel.drop(columns=["_sort"])
     
-    # Crear Excel con múltiples hojas
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        # Hoja 1: Lista completa por colección
-        df_excel.to_excel(writer, sheet_name='Por Colección', index=False)
-        
-        # Hoja 2: Resumen por colección
-        summary = df_excel.groupby("Colección").agg({
-            "Carta": "count",
-            "# Decks": "sum",
-            "Prioridad": lambda x: f"{sum(x == '⭐ Alta')} altas, {sum(x.str.contains('Media'))} medias"
-        }).reset_index()
-        summary.columns = ["Colección", "Total Cartas", "Total Usos", "Distribución"]
-        summary = summary.sort_values(by="Total Cartas", ascending=False)
-        summary.to_excel(writer, sheet_name='Resumen por Colección', index=False)
-        
-        # Hoja 3: Cartas compartidas entre decks
-        shared_cards = df_excel[df_excel["# Decks"] > 1].copy()
-        if not shared_cards.empty:
-            shared_cards = shared_cards.sort_values(by="# Decks", ascending=False)
-            shared_cards.to_excel(writer, sheet_name='Cartas Compartidas', index=False)
-        
-        # Hoja 4: Lista simple para imprimir
-        simple = df_excel[["Carta", "Colección", "Tags"]].copy()
-        simple.to_excel(writer, sheet_name='Lista para Imprimir', index=False)
-        
-        # Hoja 5: Por comandante individual
-        for commander in commanders:
-            safe_name = sanitize_commander_name(commander)[:31]  # Excel limit
-            cmd_cards = df_excel[df_excel["Comandantes"].str.contains(commander, regex=False)].copy()
-            if not cmd_cards.empty:
-                cmd_cards.to_excel(writer, sheet_name=safe_name, index=False)
-    
-    # Aplicar formato con colores
-    wb = load_workbook(output_file)
-    ws = wb['Por Colección']
-    
-    # Colores
-    high = PatternFill(start_color="FFD700", end_color="FFD700", fill_type="solid")
-    med_high = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-    med = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-    low = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")
-    shared = PatternFill(start_color="FFE6CC", end_color="FFE6CC", fill_type="solid")
-    
-    for r in range(2, ws.max_row + 1):
-        priority = ws[f"G{r}"].value
-        num_decks = ws[f"D{r}"].value
-        
+    # Crear Excel con múltiples hojas (escritura en streaming, fila a fila)
+    workbook, fmt = new_workbook(output_file)
+    
+    # Hoja 1: Lista completa por colección
+    ws = workbook.add_worksheet('Por Colección')
+    ws.write_row(0, 0, df_excel.columns, fmt["header"])
+    
+    # Hipervínculos (columna A, a partir de la URL de la columna H)
+    links_added = 0
+    for r, row in enumerate(excel_rows(df_excel), 1):
+        card, url = row[0], row[7]
+        links_added = write_card_cell(ws, r, 0, card, url, fmt["hyper"], links_added)
+        ws.write_row(r, 1, row[1:])
+    
+    # Colores como reglas de formato condicional (se guardan una vez por rango,
+    # Excel las evalúa al abrir) en vez de un relleno por celda
+    last_row = len(df_excel)
+    if last_row:
         # Resaltar cartas compartidas
-        if isinstance(num_decks, int) and num_decks > 1:
-            ws[f"D{r}"].fill = shared
+        ws.conditional_format(1, 3, last_row, 3, {
+            "type": "cell", "criteria": ">", "value": 1, "format": fmt["orange"]
+        })
         
         # Color por prioridad
-        if priority and "⭐" in priority:
-            ws[f"G{r}"].fill = high
-        elif priority and "🔥" in priority:
-            ws[f"G{r}"].fill = med_high
-        elif priority and "📘" in priority:
-            ws[f"G{r}"].fill = med
-        elif priority and "📗" in priority:
-            ws[f"G{r}"].fill = low
-        
-        # Hipervínculos
-        url = ws[f"H{r}"].value
-        if url:
-            ws[f"A{r}"].hyperlink = url
-            ws[f"A{r}"].style = "Hyperlink"
+        for priority, style in PRIORITY_STYLES.items():
+            ws.conditional_format(1, 6, last_row, 6, {
+                "type": "cell", "criteria": "==", "value": f'"{priority}"', "format": fmt[style]
+            })
+    
+    # Hoja 2: Resumen por colección
+    summary = df_excel.groupby("Colección", sort=False).agg({
+        "Carta": "count",
+        "# Decks": "sum",
+        "Prioridad": lambda x: f"{sum(x == '⭐ Alta')} altas, {sum(x.str.contains('Media'))} medias"
+    }).reset_index()
+    summary.columns = ["Colección", "Total Cartas", "Total Usos", "Distribución"]
+    summary = summary.sort_values(by="Total Cartas", ascending=False)
+    write_sheet(workbook, fmt, 'Resumen por Colección', summary)
+    
+    # Hoja 3: Cartas compartidas entre decks
+    shared_cards = df_excel[df_excel["# Decks"] > 1]
+    if not shared_cards.empty:
+        shared_cards = shared_cards.sort_values(by="# Decks", ascending=False)
+        write_sheet(workbook, fmt, 'Cartas Compartidas', shared_cards)
+    
+    # Hoja 4: Lista simple para imprimir
+    write_sheet(workbook, fmt, 'Lista para Imprimir', df_excel[["Carta", "Colección", "Tags"]])
+    
+    # Hoja 5: Por comandante individual
+    # Filas de cada comandante a partir de las listas de df_grouped (mismo índice que df_excel):
+    # una sola pasada y sin falsos positivos por coincidencias de subcadena
+    exploded = df_grouped["commander"].explode()
+    rows_by_commander = exploded.index.groupby(exploded.to_numpy())
+    
+    for commander in commanders:
+        safe_name = sanitize_commander_name(commander)[:31]  # Excel limit
+        rows = rows_by_commander.get(commander)
+        # (xlsxwriter no admite dos hojas con el mismo nombre truncado)
+        if rows is None or workbook.get_worksheet_by_name(safe_name) is not None:
+            continue
+        cmd_cards = df_excel[df_excel.index.isin(rows)]
+        if not cmd_cards.empty:
+            write_sheet(workbook, fmt, safe_name, cmd_cards)
     
-    wb.save(output_file)
+    workbook.close()
 
 
 # =========================